@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+# Merges the --stream output of ship.py from several nodes into one feed in time order, and
+# keeps rolling rates and queue times per signal while it runs. Sources are:
+#
+#   cmd:COMMAND     the output of a command, e.g. 'cmd:oc exec pod-1 -- python3 /tmp/ship.py --stream'
+#   tcp:HOST:PORT   a connection to a node that serves its stream, e.g. with
+#                   'python3 ship.py --stream | nc -l -p 9000'
+#   FILE, -         a file or named pipe, or stdin
+#
+# A source can be named with NAME=SOURCE, and the name is shown in the feed. Without a name,
+# the command, address or path is shown. Each source needs a name of its own. With --listen,
+# nodes can also connect and send their stream, e.g. 'python3 ship.py --stream | nc host 9000'.
+#
+# The nodes do not deliver their signals in time order, and not at the same pace, so the
+# signals are held until every source has sent signals at least --reorder seconds newer, and
+# are then written in time order. Signals that arrive after newer ones have been written are
+# written at once, and counted as late.
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import ship
+
+# Signals that are held longer than this many reorder windows are written anyway, so that
+# the feed does not stop when a source is quiet
+MAX_HOLD_FACTOR = 2
+# Unanswered TX signals are forgotten after this many seconds
+PAIR_TIMEOUT = 10.0
+
+class Aggregator:
+  def __init__(self, mailboxes, signals, reorder, window, max_buffer, feed):
+    self.mailboxes = mailboxes
+    self.signals = signals
+    self.reorder = reorder
+    self.window = window
+    self.max_buffer = max_buffer
+    self.feed = feed
+    self.heap = []
+    self.sequence = itertools.count()
+    self.written = None         # time of the last signal written
+    self.late = 0
+    self.sources = {}
+    self.pending = {}           # pair key -> deque of TX times
+    self.rates = {}             # signo -> deque of signal times in the window
+    self.latencies = {}         # signo -> deque of (time, queue time) in the window
+
+  def source(self, name):
+    return self.sources.setdefault(name, {'signals': 0, 'errors': 0, 'newest': None, 'done': False})
+
+  # The time up to which all sources that are still sending have been read. None while one of
+  # them has not sent anything, and infinite when all have ended.
+  def watermark(self):
+    times = [s['newest'] for s in self.sources.values() if not s['done']]
+    if None in times:
+      return None
+    return min(times, default=float('inf'))
+
+  # Adds a line of --stream output from a source
+  def add_line(self, name, line):
+    stats = self.source(name)
+    try:
+      entry = ship.parse_text_line(line)
+    except (ValueError, IndexError):
+      stats['errors'] += 1
+      return
+    if entry is None:
+      return
+    stats['signals'] += 1
+    t = entry['seconds'] + entry['microseconds']/1e6
+    if stats['newest'] is None or t > stats['newest']:
+      stats['newest'] = t
+    heapq.heappush(self.heap, (t, next(self.sequence), time.monotonic(), name, entry))
+    self.flush()
+
+  # Writes the held signals that all sources have passed by the reorder window, or that have
+  # been held too long
+  def flush(self, everything=False):
+    now = time.monotonic()
+    watermark = self.watermark()
+    limit = watermark - self.reorder if watermark is not None else float('-inf')
+    while self.heap:
+      (t, _, arrived, name, entry) = self.heap[0]
+      if not (everything or t <= limit or len(self.heap) > self.max_buffer
+              or now - arrived > self.reorder * MAX_HOLD_FACTOR):
+        break
+      heapq.heappop(self.heap)
+      self.write(t, name, entry)
+
+  def write(self, t, name, entry):
+    if self.written is not None and t < self.written:
+      self.late += 1
+    else:
+      self.written = t
+    self.update_stats(t, entry)
+
+    if self.feed:
+      timestamp = datetime.strftime(datetime.utcfromtimestamp(t), '%Y-%m-%d %H:%M:%S.%f')
+      ship.out.line("%s, %s, %s, %u, %s, %u, %s, 0x%x, %s" % (timestamp, name, "S" if entry['type'] == ship.ITC_SEND else "R",
+                                                        entry['sender'], self.mailboxes.get(entry['sender'], '<unknown>'),
+                                                        entry['receiver'], self.mailboxes.get(entry['receiver'], '<unknown>'),
+                                                        entry['signo'], self.signals.get(entry['signo'], '<unknown>')))
+
+  # Counts the signal, and pairs RX signals with the TX signals still waiting for them
+  def update_stats(self, t, entry):
+    key = (entry['signo'], entry['sender'], entry['receiver'], entry['procId'], entry['connId'])
+    if entry['type'] == ship.ITC_SEND:
+      self.rates.setdefault(entry['signo'], deque()).append(t)
+      self.pending.setdefault(key, deque()).append(t)
+    elif entry['type'] == ship.ITC_RECV:
+      sent = self.pending.get(key)
+      while sent and sent[0] < t - PAIR_TIMEOUT:
+        sent.popleft()
+      if sent and sent[0] < t:
+        self.latencies.setdefault(entry['signo'], deque()).append((t, t - sent.popleft()))
+      if sent is not None and not sent:
+        del self.pending[key]
+
+  # Drops the signals that have left the rolling window, and unanswered TX signals that timed out
+  def expire(self):
+    if self.written is None:
+      return
+    start = self.written - self.window
+    for times in self.rates.values():
+      while times and times[0] < start:
+        times.popleft()
+    for latencies in self.latencies.values():
+      while latencies and latencies[0][0] < start:
+        latencies.popleft()
+    for key in [k for (k, sent) in self.pending.items() if sent[-1] < self.written - PAIR_TIMEOUT]:
+      del self.pending[key]
+
+  def print_stats(self, top):
+    self.expire()
+    now = datetime.strftime(datetime.utcfromtimestamp(self.written), '%H:%M:%S') if self.written else '-'
+    sources = ', '.join('%s %u%s%s' % (name, s['signals'], ' (%u bad)' % s['errors'] if s['errors'] else '',
+                                        ' (ended)' if s['done'] else '')
+                        for (name, s) in self.sources.items())
+    out = ["# %s  held %u  late %u  %s" % (now, len(self.heap), self.late, sources)]
+    fmt = "{:<40} {:>9} {:>9} {:>9} {:>9}"
+    out.append(fmt.format("# Signal (last %gs)" % self.window, 'TX/s', 'p50 ms', 'p90 ms', 'max ms'))
+    busiest = sorted(((len(times), signo) for (signo, times) in self.rates.items() if times), reverse=True)[:top]
+    for (count, signo) in busiest:
+      queue = sorted(q for (_, q) in self.latencies.get(signo, ()))
+      latency = ['%.3f' % (ship.percentile(queue, p) * 1000) if queue else '-' for p in (50, 90, 100)]
+      out.append(fmt.format(self.signals.get(signo, '0x%x' % signo)[:40], '%.1f' % (count / self.window), *latency))
+    ship.print_stderr('\n'.join(out))
+
+async def read_stream(name, reader, aggregator):
+  while True:
+    line = await reader.readline()
+    if not line:
+      break
+    aggregator.add_line(name, line.decode(errors='replace'))
+  aggregator.source(name)['done'] = True
+
+async def read_command(name, command, aggregator):
+  process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE)
+  await read_stream(name, process.stdout, aggregator)
+  await process.wait()
+
+async def read_tcp(name, address, aggregator):
+  (host, port) = ship.parse_address(address)
+  try:
+    (reader, writer) = await asyncio.open_connection(host, port)
+  except OSError as e:
+    ship.print_stderr("Could not connect to %s: %s" % (address, e))
+    aggregator.source(name)['done'] = True
+    return
+  await read_stream(name, reader, aggregator)
+  writer.close()
+
+async def read_file(name, path, aggregator):
+  loop = asyncio.get_running_loop()
+  if path == '-':
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    await read_stream(name, reader, aggregator)
+    return
+  # Regular files can not be waited on by the event loop, so they are read in a thread
+  with open(path, 'rb') as fp:
+    while True:
+      line = await loop.run_in_executor(None, fp.readline)
+      if not line:
+        break
+      aggregator.add_line(name, line.decode(errors='replace'))
+  aggregator.source(name)['done'] = True
+
+# Splits a source given as [NAME=]cmd:COMMAND, [NAME=]tcp:HOST:PORT or [NAME=]FILE into
+# (name, source). The name defaults to the whole command, the address or the path.
+def split_source(spec):
+  (name, _, source) = spec.partition('=') if '=' in spec.split(':')[0] else ('', '', spec)
+  if not name:
+    name = source[4:] if source.startswith(('cmd:', 'tcp:')) else source
+  return (name, source)
+
+# Starts reading a source
+def start_source(name, source, aggregator):
+  if source.startswith('cmd:'):
+    return read_command(name, source[4:], aggregator)
+  if source.startswith('tcp:'):
+    return read_tcp(name, source[4:], aggregator)
+  return read_file(name, source, aggregator)
+
+async def run(sources, listen, aggregator, interval, top):
+  # Sources are known from the start, so that signals are held until each has sent some
+  for (name, source) in sources:
+    aggregator.source(name)
+  tasks = [asyncio.ensure_future(start_source(name, source, aggregator)) for (name, source) in sources]
+  server = None
+  if listen:
+    async def accept(reader, writer):
+      (host, port) = writer.get_extra_info('peername')[:2]
+      await read_stream('%s:%u' % (host, port), reader, aggregator)
+      writer.close()
+    (host, port) = ship.parse_address(listen)
+    server = await asyncio.start_server(accept, host, port)
+
+  next_stats = time.monotonic() + interval
+  while server or not all(task.done() for task in tasks):
+    await asyncio.sleep(min(0.1, aggregator.reorder))
+    aggregator.flush()
+    ship.out.flush()
+    if time.monotonic() >= next_stats:
+      aggregator.print_stats(top)
+      next_stats += interval
+
+  aggregator.flush(True)
+  ship.out.flush()
+  aggregator.print_stats(top)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Merge ship.py --stream output from several nodes in time order, with rolling rates and queue times per signal.')
+  parser.add_argument('sources', metavar='SOURCE', nargs='*', help='[NAME=]cmd:COMMAND, [NAME=]tcp:HOST:PORT, or [NAME=]FILE (- for stdin)')
+  parser.add_argument('--listen', metavar='[HOST:]PORT', help='also accept nodes that connect and send their --stream output')
+  parser.add_argument('--mailboxes', help='mailbox list, as the output from \'um list\'')
+  parser.add_argument('--signals', help='signal list. Format: \'NAME NUMBER_HEX NUMBER_DEC\'')
+  parser.add_argument('--reorder', metavar='SECONDS', type=float, default=1.0, help='time signals are held to be written in time order (default 1)')
+  parser.add_argument('--max-buffer', metavar='N', type=int, default=100000, help='most signals held for reordering (default 100000)')
+  parser.add_argument('--window', metavar='SECONDS', type=float, default=10.0, help='rolling window of the rates and queue times (default 10)')
+  parser.add_argument('--interval', metavar='SECONDS', type=float, default=5.0, help='time between the statistics printed to stderr (default 5)')
+  parser.add_argument('--top', metavar='N', type=int, default=15, help='number of signals in the statistics (default 15)')
+  parser.add_argument('--no-feed', action='store_true', help='only print the statistics, not the merged signals')
+  args = parser.parse_args()
+
+  if not args.sources and not args.listen:
+    parser.error('give at least one SOURCE or --listen')
+
+  # Each source keeps its own watermark, so sources can not share a name
+  sources = [split_source(spec) for spec in args.sources]
+  names = [name for (name, source) in sources]
+  duplicates = sorted(set(name for name in names if names.count(name) > 1))
+  if duplicates:
+    parser.error('sources with the same name, use NAME=SOURCE to tell them apart: %s' % ', '.join(duplicates))
+
+  # Names are resolved once, for all sources
+  mailboxes = ship.read_mailboxes(args.mailboxes) if args.mailboxes else {}
+  signal_file = args.signals or ship.find_signal_file()
+  signals = ship.parse_signals(signal_file) if signal_file else {}
+
+  aggregator = Aggregator(mailboxes, signals, args.reorder, args.window, args.max_buffer, not args.no_feed)
+  if not args.no_feed:
+    ship.out.line("time, node, direction, from_msgboxId, from_name, to_msgboxId, to_name, signalNumber, signalName")
+  try:
+    asyncio.run(run(sources, args.listen, aggregator, args.interval, args.top))
+  except KeyboardInterrupt:
+    aggregator.flush(True)
+    ship.out.flush()
+    aggregator.print_stats(args.top)
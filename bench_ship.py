@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Times the stages of ship.py on synthetic ship files from gen_ship.py, and tracks the peak
+# memory of each stage. The results are saved as JSON, and can be compared with an earlier
+# run to find regressions:
+#
+#   ./bench_ship.py --sizes 10k,1M,10M --output before.json
+#   ./bench_ship.py --sizes 10k,1M,10M --compare before.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import gen_ship
+import ship
+
+STAGES = ['read_binary', 'read_text', 'sort', 'find_pairs', 'filter_ids', 'print_summary', 'print_json']
+
+# A signal filter with each kind of match item: a regular expression, an excluded range and a number
+SIGNAL_FILTER = '_REQ$,_CFM$,-0x1000010-0x100001f,0x1000021'
+
+class NullWriter(io.TextIOBase):
+  def write(self, text):
+    return len(text)
+
+# Runs the stages once on a ship file and its text version, calling measure(stage, function)
+# around each stage. Each stage gets the output of the previous ones, as in ship.py.
+def run_stages(path, text_path, mailboxes, signals, measure):
+  data = measure('read_binary', lambda: ship.read_binary(path, False))
+  measure('read_text', lambda: ship.read_text(text_path))
+  data = measure('sort', lambda: data.sorted_by_time())
+  measure('find_pairs', lambda: ship.find_pairs(data))
+
+  def filter_signals():
+    (alls, _) = ship.filter_ids(SIGNAL_FILTER, ship.get_all_signals(data), signals)
+    return data.take([ i for (i, signo) in enumerate(data.signo) if signo in alls ])
+  measure('filter_ids', filter_signals)
+
+  with contextlib.redirect_stdout(NullWriter()):
+    measure('print_summary', lambda: ship.print_summary(data, mailboxes, signals))
+    measure('print_json', lambda: ship.print_json(data, mailboxes, signals))
+
+def time_stages(path, text_path, mailboxes, signals):
+  times = {}
+  def measure(stage, function):
+    start = time.perf_counter()
+    result = function()
+    times[stage] = time.perf_counter() - start
+    return result
+  run_stages(path, text_path, mailboxes, signals, measure)
+  return times
+
+# The peak of memory allocated during each stage, in bytes. Tracing slows the stages down,
+# so this is a separate run from the timed ones.
+def trace_stages(path, text_path, mailboxes, signals):
+  peaks = {}
+  def measure(stage, function):
+    tracemalloc.start()
+    try:
+      return function()
+    finally:
+      peaks[stage] = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+  run_stages(path, text_path, mailboxes, signals, measure)
+  return peaks
+
+# Maximum resident set size of the process so far, in bytes
+def max_rss():
+  try:
+    import resource
+  except ImportError:
+    return None
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def git_commit():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+  except OSError:
+    return None
+
+# Returns the ship file and its text version for a size, generating them if they are not
+# already in the directory from an earlier run with the same options
+def input_files(directory, count, options):
+  name = 'bench_%u_v%u_%s_m%u_s%u_k%g_w%g_r%u' % (count, options['version'], 'be' if options['endian'] == '>' else 'le',
+                                                 options['mailboxes'], options['signals'], options['skew'],
+                                                 options['wrap'], options['seed'])
+  path = os.path.join(directory, name + '.ship')
+  text_path = os.path.join(directory, name + '.txt')
+  if not os.path.exists(path) or not os.path.exists(text_path):
+    print("Generating %u entries" % count, file=sys.stderr)
+    gen_ship.generate(path, count, **options)
+    with open(text_path, 'w') as fp, contextlib.redirect_stdout(fp):
+      ship.print_ship_entries_text(ship.read_binary(path, False))
+  return (path, text_path)
+
+def format_size(value):
+  return '%.1f MB' % (value / 1e6) if value is not None else '-'
+
+def print_results(results):
+  print("%-10s %-14s %10s %10s %12s" % ('Entries', 'Stage', 'Best s', 'Median s', 'Peak memory'))
+  for r in results:
+    print("%-10u %-14s %10.3f %10.3f %12s" % (r['entries'], r['stage'], r['best'], r['median'], format_size(r['peak_memory'])))
+
+# Prints the change of each stage from an earlier run. Returns True if any stage is slower
+# by more than threshold (a fraction).
+def compare_results(results, path, threshold):
+  with open(path) as fp:
+    baseline = { (r['entries'], r['stage']): r for r in json.load(fp)['results'] }
+
+  regressed = False
+  print("\n%-10s %-14s %10s %10s %8s" % ('Entries', 'Stage', 'Before s', 'After s', 'Change'))
+  for r in results:
+    old = baseline.get((r['entries'], r['stage']))
+    if not old:
+      continue
+    change = r['best'] / old['best'] - 1 if old['best'] > 0 else 0
+    mark = ''
+    if change > threshold:
+      mark = '  slower'
+      regressed = True
+    print("%-10u %-14s %10.3f %10.3f %+7.0f%%%s" % (r['entries'], r['stage'], old['best'], r['best'], change * 100, mark))
+  return regressed
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Benchmark the stages of ship.py on synthetic ship files')
+  parser.add_argument('--sizes', default='10k,1M', help='comma delimited numbers of entries, e.g. 10k,1M,10M (default 10k,1M)')
+  parser.add_argument('--repeat', metavar='N', type=int, default=3, help='timed runs per size. The best and median are reported (default 3)')
+  parser.add_argument('--no-memory', action='store_true', help='skip the traced run that measures peak memory per stage')
+  parser.add_argument('--dir', help='keep the generated files in this directory, and reuse them in later runs')
+  parser.add_argument('--output', metavar='FILE', help='save the results as JSON to FILE')
+  parser.add_argument('--compare', metavar='FILE', help='compare with the results saved in FILE, and exit with 1 if a stage is slower')
+  parser.add_argument('--threshold', metavar='PERCENT', type=float, default=10.0, help='slowdown that counts as a regression in --compare (default 10)')
+  gen_ship.add_generator_arguments(parser)
+  args = parser.parse_args()
+
+  sizes = [ gen_ship.parse_count(s) for s in args.sizes.split(',') ]
+  options = gen_ship.generator_options(args)
+  # The ship.py options used by the stages
+  ship.args = argparse.Namespace(little_endian=False, dont_convert_hex_data=False)
+
+  directory = args.dir or tempfile.mkdtemp()
+  os.makedirs(directory, exist_ok=True)
+  results = []
+  try:
+    mailbox_list = os.path.join(directory, 'mailboxes.txt')
+    signal_list = os.path.join(directory, 'signals.txt')
+    gen_ship.write_mailbox_list(mailbox_list, args.mailboxes)
+    gen_ship.write_signal_list(signal_list, args.signals)
+    mailboxes = ship.read_mailboxes(mailbox_list)
+    signals = ship.parse_signals(signal_list)
+
+    for count in sizes:
+      (path, text_path) = input_files(directory, count, options)
+      print("Running %u entries" % count, file=sys.stderr)
+      runs = [ time_stages(path, text_path, mailboxes, signals) for i in range(args.repeat) ]
+      peaks = trace_stages(path, text_path, mailboxes, signals) if not args.no_memory else {}
+      for stage in STAGES:
+        times = sorted(run[stage] for run in runs)
+        results.append({'entries': count, 'stage': stage, 'times': times, 'best': times[0],
+                        'median': times[len(times) // 2], 'peak_memory': peaks.get(stage)})
+  finally:
+    if not args.dir:
+      shutil.rmtree(directory)
+
+  print_results(results)
+  print("Max RSS: %s" % format_size(max_rss()))
+
+  if args.output:
+    with open(args.output, 'w') as fp:
+      json.dump({'date': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'generator': options, 'repeat': args.repeat, 'max_rss': max_rss(),
+                 'results': results}, fp, indent=2)
+
+  if args.compare and compare_results(results, args.compare, args.threshold / 100):
+    exit(1)
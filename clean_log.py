@@ -1,21 +1,37 @@
 #!/usr/bin/env python3
 import re
+import sys
 import argparse
 
+ANSI_ESCAPE = re.compile(rb'\x1B[@-_][0-?]*[ -/]*[@-~]')
+BLOCK_SIZE = 1 << 20
+
 def remove_ansi_escape_codes(text):
-    ansi_escape = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
-    return ansi_escape.sub('', text)
+    return ANSI_ESCAPE.sub(b'', text)
 
-def main(file_name: str):
-    with open('temp_output.txt', 'r') as infile, open(file_name, 'w') as outfile:
-        for line in infile:
-            clean_line = remove_ansi_escape_codes(line)
-            outfile.write(clean_line)
+def main(file_name: str, input_file=None):
+    # Escape codes never span lines, so blocks are cut after their last newline
+    # and the rest is carried over to the next block
+    infile = open(input_file, 'rb') if input_file else sys.stdin.buffer
+    with infile, open(file_name, 'wb', buffering=BLOCK_SIZE) as outfile:
+        rest = b''
+        while True:
+            block = infile.read(BLOCK_SIZE)
+            if not block:
+                break
+            end = block.rfind(b'\n') + 1
+            if end == 0:
+                rest += block
+                continue
+            outfile.write(remove_ansi_escape_codes(rest + block[:end]))
+            rest = block[end:]
+        outfile.write(remove_ansi_escape_codes(rest))
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Clean output log.")
+    parser = argparse.ArgumentParser(description="Clean output log. Reads the colored output from stdin, e.g. present_ship.py ... | clean_log.py FILE")
     parser.add_argument("file_name", help="Final output file name.")
+    parser.add_argument("-i", "--input", help="Read the colored output from this file instead of stdin.")
 
     args = parser.parse_args()
 
-    main(args.file_name)
+    main(args.file_name, args.input)
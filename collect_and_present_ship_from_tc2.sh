@@ -11,7 +11,7 @@ module add python/3.8
 
 # Function to display usage information
 usage() {
-    echo "Usage: $0 (-i <ipaddress> | -p <podname>) [-a] [-t <timestamp>] [-j/-s <filename>] [-m <module(s)>] "
+    echo "Usage: $0 (-i <ipaddress> | -p <podname>) [-a] [-t <timestamp>] [-j/-s <filename>] [-m <module(s)> [-r [-S <signals>] [-M <mailboxes>]] [-A <database>]]"
     echo " -i <ipaddress>   Use an IP address for operations"
     echo " -p <podname>     Use a Kubernetes pod name for operations"
     echo " -a               Open the result in Aether"         
@@ -19,6 +19,10 @@ usage() {
     echo " -j <filename>    Save the JSON file to a specified file"
     echo " -s <filename>    Save the log to the specified file"
     echo " -m <modulenames> Separate each module with commas and no spaces: ORC,OFHCC,..."
+    echo " -r               Filter the module .ship files on the node with ship.py before transfer (-t, -S, -M)"
+    echo " -S <signals>     With -r: comma delimited signals to include (or exclude if prepended with -)"
+    echo " -M <mailboxes>   With -r: comma delimited mailboxes to include (or exclude if prepended with -)"
+    echo " -A <database>    With -m: add the signals not already in the SQLite database, e.g. for repeated collections"
     exit 1
 }
 
@@ -29,6 +33,10 @@ cleanup() {
         # Remove the temporary directory
         rm -rf "$TEMP_DIR" # "-rf": "-r" = recursive deletion. "-f" = force deletion w/out confirmation 
     fi
+    # The work directory of -r on the target, if the script stopped before it was removed
+    if [ -n "$REMOTE_WORK" ]; then
+        remote "rm -rf $REMOTE_WORK" || true
+    fi
 }
 
 # Trap to ensure cleanup is called on EXIT
@@ -53,9 +61,14 @@ POD_NAME=""
 JSON_OUTPUT_NAME=""
 TIMESTAMP=""
 OUTPUT_FILENAME=""
+REMOTE_FILTER=false
+REMOTE_WORK=""
+SIGNAL_FILTER=""
+MAILBOX_FILTER=""
+ARCHIVE=""
 
 # Parse command-line options
-while getopts ":i:p:aj:s:t:m:" opt; do
+while getopts ":i:p:aj:s:t:m:rS:M:A:" opt; do
     case $opt in
         i) IP_ADDRESS="$OPTARG"
         ;;
@@ -63,12 +76,20 @@ while getopts ":i:p:aj:s:t:m:" opt; do
         ;;
         a) AETHER=true
         ;;
-        j) JSON_OUTPUT_DIR="$OPTARG"
+        j) JSON_OUTPUT_NAME="$OPTARG"
         ;;
         t) TIMESTAMP="$OPTARG"
         ;;
         s) OUTPUT_FILENAME="$OPTARG"
         ;;
+        r) REMOTE_FILTER=true
+        ;;
+        S) SIGNAL_FILTER="$OPTARG"
+        ;;
+        M) MAILBOX_FILTER="$OPTARG"
+        ;;
+        A) ARCHIVE="$OPTARG"
+        ;;
         m) readarray -td, arr <<<"$OPTARG, "; unset 'arr[-1]'; declare -p arr;
 		;;
         \?) echo "Invalid option -$OPTARG" >&2 # >& ends the command 
@@ -94,61 +115,123 @@ elif [ -z "$IP_ADDRESS" ] && [ -z "$POD_NAME" ]; then # "-z" checks if the strin
     usage
 fi
 
-if [ -n "$IP_ADDRESS" ]; then # If IP address is provided...
-
-    if [ -n "$arr" ]; then # Modules provided
-        for path in $arr; do
-	    
-            DIRECTORY=$(oc exec $POD_NAME -- find /tmp/applicationtmp -name "*$path*" -type d)
-	    
-            if [ -z "$(oc exec $POD_NAME -- ls $DIRECTORY)" ]; then
-                echo "$DIRECTORY does not exist or is empty."
-                continue;
-            fi
-	    
-            FILES=$(oc exec $POD_NAME -- find $DIRECTORY -name "*.ship")
-	    
-            for FILE in $FILES; do # Loop through all files ending in .whip
-                REMOTE_PATH="root@$IP_ADDRESS:$FILE"
-                sshpass -p "$PASSWORD" scp $REMOTE_PATH "$TEMP_DIR" 
-                
-                sshpass -p "$PASSWORD" ssh root@${IP_ADDRESS} "um list" > "$TEMP_DIR/mailboxes.txt"
-            done
-        done
-    else # Other logs
-        REMOTE_PATH="root@$IP_ADDRESS:/tmp/applicationtmp/*/*.ship.whip" # Path to the remote file, includes all files ending in .ship.whip
-        
-        # Copies the file to the temp directory
-        sshpass -p "$PASSWORD" scp $REMOTE_PATH "$TEMP_DIR"  # Uses sshpass to get password for scp command
-        # Executes "um list" in remote VDI using ssh
-        sshpass -p "$PASSWORD" ssh root@${IP_ADDRESS} "um list" > "$TEMP_DIR/mailboxes.txt" # Directs output from remote to local file in temp directory
+if $REMOTE_FILTER && [ -z "$arr" ]; then
+    echo "Option '-r' requires '-m'"
+    usage
+fi
+
+if [ -n "$ARCHIVE" ] && [ -z "$arr" ]; then
+    echo "Option '-A' requires '-m'"
+    usage
+fi
+
+# Runs a shell command on the target: over ssh with -i, in the pod with -p
+remote() {
+    if [ -n "$IP_ADDRESS" ]; then
+        sshpass -p "$PASSWORD" ssh root@${IP_ADDRESS} "$1"
+    else
+        oc exec -i $POD_NAME -- sh -c "$1"
+    fi
+}
+
+# Fetches all files listed by a remote command in one compressed tar stream, instead of
+# one copy per file, and extracts them flat into the temp directory like the copies did.
+# zstd is used if both sides have it, otherwise gzip.
+fetch_files() {
+    local list_cmd="$1"
+    local compress="cat"
+    local decompress="cat"
+    if command -v zstd > /dev/null && remote "command -v zstd" > /dev/null 2>&1; then
+        compress="zstd -c -q"
+        decompress="zstd -dc -q"
+    elif remote "command -v gzip" > /dev/null 2>&1; then
+        compress="gzip -c -1"
+        decompress="gzip -dc"
+    fi
+
+    local archive="$TEMP_DIR/transfer.tar"
+    local start=$(date +%s%N)
+    remote "cd / && $list_cmd | tar -cf - -T - | $compress" > "$archive"
+    local elapsed_ms=$(( ($(date +%s%N) - start) / 1000000 ))
+
+    $decompress < "$archive" | tar -xf - -C "$TEMP_DIR" --transform='s|.*/||'
+    local transferred=$(stat -c %s "$archive")
+    rm "$archive"
+
+    # Report the number of files, and the transfer size and rate
+    find "$TEMP_DIR" -maxdepth 1 -type f \( -name "*.ship" -o -name "*.whip" \) -printf "%s\n" | \
+        awk -v bytes=$transferred -v ms=$elapsed_ms '{ size += $1; files++ }
+            END { printf "Fetched %d files, %.1f MB (%.1f MB transferred) in %.1f s, %.1f MB/s\n",
+                         files, size / 1e6, bytes / 1e6, ms / 1000, (ms > 0 ? bytes / 1e3 / ms : 0) }'
+}
+
+# Quotes a value for the remote shell
+quote() {
+    printf "'%s'" "$(printf '%s' "$1" | sed "s/'/'\\\\''/g")"
+}
+
+# Runs ship.py on the node to keep only the signals matching -t, -S and -M, and fetches
+# them as one compact ship file. The whole rings are never transferred.
+fetch_filtered() {
+    local find_cmd="$1"
+    local work="/tmp/ship_collect"
+    local options="--mailboxes $work/mailboxes.txt --signals $work/signal_list"
+    if [ -n "$TIMESTAMP" ]; then
+        options="$options --from $(quote "$TIMESTAMP")"
     fi
-elif [ -n "$POD_NAME" ]; then # If pod name provided...
-
-    FILES=()
-
-    if [ -n "$arr" ]; then # Modules provided
-        for path in ${arr[@]}; do
-            DIRECTORY=$(oc exec $POD_NAME -- find /tmp/applicationtmp -name "*$path*" -type d)
-	    
-            if [ -z "$(oc exec $POD_NAME -- ls $DIRECTORY)" ]; then
-                echo "$DIRECTORY does not exist or is empty."
-                continue;
-            fi
-            FILES+=($(oc exec $POD_NAME -- find $DIRECTORY -name "*.ship"))
-        done
-    else # Other logs
-        FILES=$(oc exec $POD_NAME -- find /tmp -name "*.whip") # Finds the files inside a Kubernetes pod
+    if [ -n "$SIGNAL_FILTER" ]; then
+        options="$options --signal-filter=$(quote "$SIGNAL_FILTER")"
     fi
-    
-    for FILE in ${FILES[@]}; do # Loop through all files ending in .whip
-        echo "copying file $FILE" 
-        file_name=$(basename $FILE) # Extracts the file name using basename
-        oc cp ${POD_NAME}:${FILE} $TEMP_DIR/$file_name # Copies the file into local temp dir with the same nam
-        echo "done!"
+    if [ -n "$MAILBOX_FILTER" ]; then
+        options="$options --mailbox-filter=$(quote "$MAILBOX_FILTER")"
+    fi
+
+    echo "filter on the node"
+    REMOTE_WORK="$work"
+    tar -cf - -C "$DIR" ship.py signal_list | remote "mkdir -p $work && tar -xf - -C $work"
+    # Finding no files is not an error, nothing is fetched then. ship.py exits with 1 when the
+    # filters select no signals, which is reported but does not stop the script.
+    local status=0
+    remote "um list > $work/mailboxes.txt; files=\$(cd / && $find_cmd); [ -n \"\$files\" ] || exit 0; \
+            cd / && python3 $work/ship.py \$files $options --extract $work/extract.ship" || status=$?
+    if [ $status -eq 0 ]; then
+        fetch_files "ls ${work#/}/extract.ship 2> /dev/null"
+    else
+        echo "Filtering on the node failed or selected no signals (exit status $status)"
+    fi
+    remote "rm -rf $work"
+    REMOTE_WORK=""
+}
+
+if [ -n "$arr" ]; then # Modules provided
+    # One find for all modules: .ship files in a directory named after any of the modules
+    MODULE_PATHS=""
+    for path in "${arr[@]}"; do
+        MODULE_PATHS="$MODULE_PATHS -o -path '*${path}*/*'"
     done
-    echo "copy mailboxes"
-    oc exec $POD_NAME -- um list > $TEMP_DIR/mailboxes.txt # Executes um list in pod and directs output into temp director
+    MODULE_FIND="find tmp/applicationtmp \( ${MODULE_PATHS# -o } \) -name '*.ship' -type f"
+    if $REMOTE_FILTER; then
+        fetch_filtered "$MODULE_FIND"
+    else
+        fetch_files "$MODULE_FIND"
+    fi
+
+    if [ -z "$(ls $TEMP_DIR/*.ship 2> /dev/null)" ]; then
+        echo "No .ship files found for modules: ${arr[*]}"
+    fi
+elif [ -n "$IP_ADDRESS" ]; then # Other logs, from the application directories
+    fetch_files "find tmp/applicationtmp -mindepth 2 -maxdepth 2 -name '*.ship.whip' -type f"
+else # Other logs, from anywhere in the pod
+    fetch_files "find tmp -name '*.whip' -type f"
+fi
+
+# Executes "um list" on the target once and directs the output to a local file in the temp directory
+echo "copy mailboxes"
+remote "um list" > "$TEMP_DIR/mailboxes.txt"
+
+# Only the signals that were not in an earlier collection are added to the archive
+if [ -n "$ARCHIVE" ] && [ -n "$(ls $TEMP_DIR/*.ship 2> /dev/null)" ]; then
+    python3 ${DIR}/ship.py $TEMP_DIR/*.ship --mailboxes $TEMP_DIR/mailboxes.txt --signals ${DIR}/signal_list --sqlite "$ARCHIVE" --append
 fi
 
 if $AETHER; then
@@ -167,22 +250,26 @@ fi
 # Expand DIR (go to directory and then open shipit)
 # TEMP_DIR is a command (see var init): makes temporary files
 # Redirects stdout into the provided json file
+# The .ship files of the modules are presented directly, so JSON is only made for them when -j is given
 if [ -n "$arr" ]; then
-    ${DIR}/ship.py $TEMP_DIR/*.ship --mailboxes $TEMP_DIR/mailboxes.txt --signals ${DIR}/signal_list --json > $JSON_FILE
+    if [ -n "$JSON_OUTPUT_NAME" ]; then
+        ${DIR}/ship.py $TEMP_DIR/*.ship --mailboxes $TEMP_DIR/mailboxes.txt --signals ${DIR}/signal_list --json > $JSON_FILE
+    fi
 else
     ${DIR}/shipit $TEMP_DIR/*.whip -m $TEMP_DIR/mailboxes.txt > $JSON_FILE
 fi
 
 # Copy JSON file to the specified directory if provided
-if [ -n "$JSON_OUTPUT_DIR" ]; then
+if [ -n "$JSON_OUTPUT_NAME" ]; then
     cp $JSON_FILE "$JSON_OUTPUT_NAME"
     echo "JSON file copied to $JSON_OUTPUT_NAME"
 fi
 
 # Using different python scripts for ORC/OFHCC/OFHRRC displays
+# present_ship.py decodes the module .ship files with ship.py and renders them without a JSON round trip
 python_script="${DIR}/present_shipit_json.py $JSON_FILE -p -n"
 if [ -n "$arr" ]; then
-    python_script="${DIR}/present_shipit_json_orc.py $JSON_FILE -i -g -n"
+    python_script="${DIR}/present_ship.py $TEMP_DIR/*.ship --mailboxes $TEMP_DIR/mailboxes.txt --signals ${DIR}/signal_list -i -g -n"
 fi
 
 # Sort for timestamp
@@ -192,9 +279,7 @@ if [ -n "$TIMESTAMP" ]; then
 fi
 
 if [ -n "$OUTPUT_FILENAME" ]; then # Output to be saved externally
-    python3 $python_script $time > "temp_output.txt" # Redirect script output into specified output
-    python3 ${DIR}/clean_log.py "$OUTPUT_FILENAME" # Clean up ASCII characters and store clean output
-    rm temp_output.txt
+    python3 $python_script $time --no-color > "$OUTPUT_FILENAME" # Render without color codes straight into the output
     echo "Output saved to $OUTPUT_FILENAME"
 else
     python3 $python_script $time
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# Generates synthetic ship files that ship.py can read, e.g. for benchmarks (see bench_ship.py)
+# or to try out options without access to a node. The same options and seed give the same file.
+
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+
+ITC_SEND = 0
+ITC_RECV = 1
+
+FIRST_MAILBOX = 100
+FIRST_SIGNAL = 0x1000000
+CHUNK = 100000
+
+# Parses a count like 10000, 10k or 1M
+def parse_count(text):
+  multipliers = {'k': 1000, 'm': 1000000}
+  try:
+    if text[-1:].lower() in multipliers:
+      return int(float(text[:-1]) * multipliers[text[-1:].lower()])
+    return int(text)
+  except ValueError:
+    raise argparse.ArgumentTypeError("invalid count '%s', expected e.g. 10000, 10k or 1M" % text)
+
+# Cumulative weights where the i:th key is picked in proportion to 1 / (i + 1)^skew.
+# Skew 0 is uniform, and higher skews concentrate the signals on a few hot keys.
+def zipf_weights(n, skew):
+  weights = []
+  total = 0.0
+  for i in range(n):
+    total += 1.0 / (i + 1) ** skew
+    weights.append(total)
+  return weights
+
+# Yields the entries in time order as (time, type, sender, receiver, signo, procId, connId).
+# Each signal is a TX entry followed by its RX entry, except a fraction of unpaired signals
+# that are only sent. count is the number of entries, not signals.
+def generate_entries(count, mailboxes, signals, skew, unpaired, rate, start, rng):
+  signal_weights = zipf_weights(signals, skew)
+  mailbox_weights = zipf_weights(mailboxes, skew)
+  t = start
+  produced = 0
+  while produced < count:
+    n = min(CHUNK, count - produced)
+    signos = rng.choices(range(signals), cum_weights=signal_weights, k=n)
+    senders = rng.choices(range(mailboxes), cum_weights=mailbox_weights, k=n)
+    receivers = rng.choices(range(mailboxes), cum_weights=mailbox_weights, k=n)
+    for i in range(n):
+      if produced >= count:
+        break
+      t += rng.expovariate(rate)
+      signal = (FIRST_MAILBOX + senders[i], FIRST_MAILBOX + receivers[i], FIRST_SIGNAL + signos[i],
+                rng.randint(1, 64), rng.randint(1, 1024))
+      yield (t, ITC_SEND) + signal
+      produced += 1
+      if produced < count and rng.random() >= unpaired:
+        yield (t + rng.expovariate(2000.0), ITC_RECV) + signal
+        produced += 1
+
+# Packs entries in the record layout of a file version and byte order
+def pack_entries(entries, version, endian):
+  if version == 1:
+    record = struct.Struct(endian + 'HxxIIIiiII')
+    for (t, kind, sender, receiver, signo, proc_id, conn_id) in entries:
+      yield record.pack(kind, 0, sender, receiver, int(t), int(t % 1 * 1e6), signo, 0)
+  else:
+    record = struct.Struct(endian + 'iiIIIII4s4s')
+    for (t, kind, sender, receiver, signo, proc_id, conn_id) in entries:
+      yield record.pack(int(t), int(t % 1 * 1e6), 0, kind, sender, receiver, signo,
+                        struct.pack('>I', proc_id), struct.pack('>I', conn_id))
+
+def ship_header(version, endian):
+  if version == 1:
+    # Version 1 files have a 4 byte version where version 2 has the byte order mark and version
+    return b'SHIP' + struct.pack(endian + 'I', 1)
+  return b'SHIP' + struct.pack(endian + 'HH', 0xFEFF, 2)
+
+def record_size(version):
+  return struct.calcsize('HxxIIIiiII' if version == 1 else 'iiIIIII4s4s')
+
+# Writes a ship file with count entries. A wrap between 0 and 1 writes the file as a ring
+# that has wrapped that fraction of the way around, so that the newest entries come first.
+# free adds that many unused (zero) entries at the end, like a ring that is not full.
+def generate(path, count, version=2, endian='>', mailboxes=50, signals=200, skew=1.0, unpaired=0.1,
+             wrap=0.0, free=0, rate=10000.0, start=1700000000.0, seed=1):
+  rng = random.Random(seed)
+  entries = generate_entries(count, mailboxes, signals, skew, unpaired, rate, start, rng)
+  size = record_size(version)
+  newest = int(count * wrap)
+
+  with open(path, 'wb') as fp:
+    fp.write(ship_header(version, endian))
+    # The oldest entries are kept in a temporary file until the newest have been written
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path))) as oldest:
+      out = oldest if newest else fp
+      written = 0
+      pending = []
+      for data in pack_entries(entries, version, endian):
+        pending.append(data)
+        written += 1
+        if written == count - newest:
+          out.write(b''.join(pending))
+          pending = []
+          out = fp
+        elif len(pending) == CHUNK:
+          out.write(b''.join(pending))
+          pending = []
+      out.write(b''.join(pending))
+
+      oldest.seek(0)
+      while True:
+        data = oldest.read(CHUNK * size)
+        if not data:
+          break
+        fp.write(data)
+    fp.write(bytes(free * size))
+
+# Writes mailbox and signal lists, in the formats of 'um list' and signal_list, for the
+# mailbox and signal ids in the generated files
+def write_mailbox_list(path, mailboxes):
+  with open(path, 'w') as fp:
+    fp.write("Id      Name\n")
+    for i in range(mailboxes):
+      fp.write("%-7u %s\n" % (FIRST_MAILBOX + i, "MBOX_%u" % i))
+
+def write_signal_list(path, signals):
+  suffixes = ['_REQ', '_CFM', '_REJ', '_IND']
+  with open(path, 'w') as fp:
+    for i in range(signals):
+      fp.write("SIG_%u%s 0x%x %u gen.sig\n" % (i // 4, suffixes[i % 4], FIRST_SIGNAL + i, FIRST_SIGNAL + i))
+
+# The generator options, shared with bench_ship.py
+def add_generator_arguments(parser):
+  parser.add_argument('--version', type=int, choices=[1, 2], default=2, help='ship file version (default 2)')
+  parser.add_argument('--endian', choices=['big', 'little'], default='big', help='byte order of the file (default big)')
+  parser.add_argument('--mailboxes', metavar='N', type=int, default=50, help='number of distinct mailboxes (default 50)')
+  parser.add_argument('--signals', metavar='N', type=int, default=200, help='number of distinct signals (default 200)')
+  parser.add_argument('--skew', metavar='S', type=float, default=1.0, help='Zipf exponent of signal and mailbox popularity. 0 is uniform (default 1)')
+  parser.add_argument('--unpaired', metavar='F', type=float, default=0.1, help='fraction of signals without an RX entry (default 0.1)')
+  parser.add_argument('--wrap', metavar='F', type=float, default=0.0, help='write the file as a ring that has wrapped this fraction (0-1) of the way around')
+  parser.add_argument('--free', metavar='N', type=parse_count, default=0, help='number of unused entries at the end of the ring')
+  parser.add_argument('--rate', metavar='N', type=float, default=10000.0, help='average signals per second (default 10000)')
+  parser.add_argument('--seed', type=int, default=1, help='random seed (default 1)')
+
+def generator_options(args):
+  return {'version': args.version, 'endian': '>' if args.endian == 'big' else '<', 'mailboxes': args.mailboxes,
+          'signals': args.signals, 'skew': args.skew, 'unpaired': args.unpaired, 'wrap': args.wrap,
+          'free': args.free, 'rate': args.rate, 'seed': args.seed}
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description='Generate a synthetic ship file')
+  parser.add_argument('output', metavar='FILE', help='the ship file to write')
+  parser.add_argument('-n', '--entries', metavar='N', type=parse_count, default=10000, help='number of entries, e.g. 10k or 1M (default 10k)')
+  parser.add_argument('--mailbox-list', metavar='FILE', help='also write the mailbox names to FILE, for ship.py --mailboxes')
+  parser.add_argument('--signal-list', metavar='FILE', help='also write the signal names to FILE, for ship.py --signals')
+  add_generator_arguments(parser)
+  args = parser.parse_args()
+
+  if not 0 <= args.wrap < 1:
+    print("--wrap must be at least 0 and less than 1", file=sys.stderr)
+    exit(1)
+
+  generate(args.output, args.entries, **generator_options(args))
+  if args.mailbox_list:
+    write_mailbox_list(args.mailbox_list, args.mailboxes)
+  if args.signal_list:
+    write_signal_list(args.signal_list, args.signals)
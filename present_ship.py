@@ -0,0 +1,557 @@
+#!/usr/bin/env python3
+"""Pretty-print SHIP events in a terminal.
+
+The events come from shipit JSON ({"events": [...]}), from ship.py --json output (a JSON
+array, or NDJSON), or straight from .ship files decoded with ship.py. A schema adapter
+converts each kind of record to one event format, which the rest of the module renders.
+present_shipit_json.py and present_shipit_json_orc.py are the command lines for the two
+JSON formats.
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+# ANSI color codes
+COLORS = {
+    "RESET": "\033[0m",
+    "BOLD": "\033[1m",
+    "BLACK": '\033[30m',
+    "RED": '\033[31m',
+    "GREEN": '\033[32m',
+    "YELLOW": '\033[93m',
+    "BLUE": '\033[34m',
+    "MAGENTA": '\033[35m',
+    "CYAN": '\033[36m',
+    "LIGHT_GRAY": '\033[37m',
+    "DARK_GRAY": '\033[90m',
+    "BRIGHT_RED": '\033[91m',
+    "BRIGHT_GREEN": '\033[92m',
+    "BRIGHT_YELLOW": '\033[33m',
+    "BRIGHT_BLUE": '\033[94m',
+    "BRIGHT_MAGENTA": '\033[95m',
+    "BRIGHT_CYAN": '\033[96m',
+    "WHITE": '\033[97m'
+}
+
+PARTICIPANT_COLORS = [
+    COLORS["DARK_GRAY"], COLORS["BLUE"], COLORS["MAGENTA"], COLORS["CYAN"],
+    COLORS["RED"], COLORS["GREEN"], COLORS["YELLOW"], COLORS["BRIGHT_BLUE"], COLORS["BRIGHT_MAGENTA"]
+]
+
+SIGNO_COLORS = [
+    COLORS["DARK_GRAY"], COLORS["BLUE"], COLORS["MAGENTA"], COLORS["CYAN"],
+    COLORS["RED"], COLORS["GREEN"], COLORS["YELLOW"], COLORS["BRIGHT_BLUE"], COLORS["BRIGHT_MAGENTA"]
+]
+
+def load_json(file_name: str) -> Dict[str, Any]:
+    """Load JSON data from a file."""
+    try:
+        with open(file_name) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Error: The file '{file_name}' was not found.")
+        exit(1)
+    except json.JSONDecodeError:
+        print(f"Error: The file '{file_name}' is not valid JSON.")
+        exit(1)
+
+def iter_json_events(file_name: str, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """Yield the elements of a JSON array, or the values of an NDJSON file, one at a time."""
+    decoder = json.JSONDecoder()
+    try:
+        with open(file_name) as f:
+            buf = ''
+            pos = 0
+            eof = False
+            need_more = False
+            in_array = None
+            while True:
+                # Skip whitespace, and commas between array elements
+                while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ',')):
+                    pos += 1
+                if pos == len(buf) or need_more:
+                    if eof:
+                        if need_more or in_array:
+                            raise json.JSONDecodeError("Unexpected end of file", buf, len(buf))
+                        break
+                    more = f.read(chunk_size)
+                    eof = not more
+                    buf, pos, need_more = buf[pos:] + more, 0, False
+                    continue
+
+                if in_array is None:
+                    in_array = buf[pos] == '['
+                    if in_array:
+                        pos += 1
+                    continue
+                if in_array and buf[pos] == ']':
+                    break
+
+                try:
+                    element, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    need_more = True
+                    continue
+                # A value that reaches the end of the buffer may continue in the next chunk
+                if end == len(buf) and not eof:
+                    need_more = True
+                    continue
+                yield element
+                pos = end
+    except FileNotFoundError:
+        print(f"Error: The file '{file_name}' was not found.")
+        exit(1)
+    except json.JSONDecodeError:
+        print(f"Error: The file '{file_name}' is not valid JSON.")
+        exit(1)
+
+# Event name colors by type suffix, matched on the lower case name
+EVENT_TYPE_PATTERN = re.compile(r'(req|cfm|rej|ind|fwd|rsp)\d*$')
+EVENT_TYPE_COLORS = {
+    'req': COLORS["BRIGHT_BLUE"],
+    'cfm': COLORS["BRIGHT_GREEN"],
+    'rej': COLORS["BRIGHT_RED"],
+    'ind': COLORS["BRIGHT_YELLOW"],
+    'fwd': COLORS["BRIGHT_BLUE"],
+    'rsp': COLORS["BRIGHT_GREEN"]
+}
+
+# The formatting below is cached, as there are far fewer distinct names than events
+FORMAT_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def colorize_event_name(event_name: str) -> str:
+    """Colorize event names based on their type and abbreviate names ending with _Pb."""
+    match = EVENT_TYPE_PATTERN.search(event_name.lower())
+    
+    # Check if the event name contains _Pb and abbreviate the preceding text
+    if '_Pb' in event_name:
+        parts = event_name.split('_Pb')
+        abbreviation = ''.join([char for char in parts[0] if char.isupper()])
+        event_name = f"{abbreviation}_Pb{parts[1]}"
+    
+    if match:
+        return f"{EVENT_TYPE_COLORS[match.group(1)]}{event_name}{COLORS['RESET']}"
+    return f"{COLORS['LIGHT_GRAY']}{event_name}{COLORS['RESET']}"
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_event_name(event_name: str, width: int) -> str:
+    """Truncate, colorize and pad an event name column."""
+    # The column is 6 wider than the name, plus the color codes around it
+    padding = width + 6 + len(COLORS['LIGHT_GRAY']) + len(COLORS['RESET'])
+    return f"{colorize_event_name(truncate_string(event_name, width)):<{padding}}  "
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_participant(name: str, color: str, width: int) -> str:
+    """Color and pad a sender or receiver column."""
+    return f"{color}{name:<{width}}  {COLORS['RESET']}"
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def truncate_string(s: str, max_length: int) -> str:
+    """Truncate a string to a maximum length."""
+    return s if len(s) <= max_length else s[:max_length - 3] + "..."
+
+def disable_colors() -> None:
+    """Render without ANSI color codes, e.g. for output that is saved to a file."""
+    for name in COLORS:
+        COLORS[name] = ''
+    PARTICIPANT_COLORS[:] = [''] * len(PARTICIPANT_COLORS)
+    SIGNO_COLORS[:] = [''] * len(SIGNO_COLORS)
+    for name in EVENT_TYPE_COLORS:
+        EVENT_TYPE_COLORS[name] = ''
+    for cached in (colorize_event_name, format_event_name, format_participant):
+        cached.cache_clear()
+
+def colorize_element(element: Any) -> str:
+    """Colorize JSON elements."""
+    if isinstance(element, dict):
+        items = [f'{COLORS["BRIGHT_YELLOW"]}"{k}"{COLORS["RESET"]}: {colorize_element(v)}' for k, v in element.items()]
+        return '{' + ', '.join(items) + '}'
+    elif isinstance(element, list):
+        items = [colorize_element(i) for i in element]
+        return '[' + ', '.join(items) + ']'
+    elif isinstance(element, str):
+        return f'{COLORS["BRIGHT_GREEN"]}"{element}"{COLORS["RESET"]}'
+    elif isinstance(element, (int, float)):
+        return f'{COLORS["BRIGHT_CYAN"]}{element}{COLORS["RESET"]}'
+    elif isinstance(element, bool):
+        return f'{COLORS["BRIGHT_BLUE"]}{element}{COLORS["RESET"]}'
+    elif element is None:
+        return f'{COLORS["BRIGHT_RED"]}null{COLORS["RESET"]}'
+    else:
+        return str(element)
+
+def colorize_json(json_str: str) -> str:
+    """Colorize a JSON string."""
+    try:
+        parsed_json = json.loads(json_str)
+        return colorize_element(parsed_json)
+    except json.JSONDecodeError:
+        return "Invalid JSON"
+
+def convert_list_to_hex_and_ascii(int_list: List[int]) -> str:
+    """Convert a list of integers to a hex and ASCII string."""
+    ascii_values = ''.join(f'{COLORS["BRIGHT_GREEN"]}{chr(i) if 32 <= i <= 126 else "."}{COLORS["RESET"]}' for i in int_list)
+    hex_values = ' '.join(f'{COLORS["BRIGHT_CYAN"]}{i:02x}{COLORS["RESET"]}' for i in int_list)
+    return f"{ascii_values} {hex_values}"
+
+# Time of day in an ISO timestamp, e.g. 2024-01-01T10:02:00.123456Z or 2024-01-01 10:02:00.123456
+TIME_OF_DAY_PATTERN = re.compile(r'[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?')
+
+def time_of_day_us(timestamp: str) -> Optional[int]:
+    """Return the time of day of a timestamp in microseconds, or None if it has none."""
+    match = TIME_OF_DAY_PATTERN.search(timestamp)
+    if not match:
+        return None
+    hours, minutes, seconds, fraction = match.groups()
+    return (int(hours) * 3600 + int(minutes) * 60 + int(seconds)) * 1000000 + int((fraction or '0').ljust(6, '0'))
+
+def parse_time_range(filter_time: Optional[str], until_time: Optional[str], window: Optional[float]) -> Tuple[Optional[int], Optional[int]]:
+    """Convert -t/--until (HH:MM:SS) and --window (seconds after -t) to a range of times of day in microseconds."""
+    def to_us(text: str) -> int:
+        t = datetime.strptime(text, "%H:%M:%S").time()
+        return (t.hour * 3600 + t.minute * 60 + t.second) * 1000000
+
+    start = to_us(filter_time) if filter_time else None
+    end = to_us(until_time) if until_time else None
+    if window is not None:
+        if start is None:
+            print("Error: --window needs a start time, see -t.")
+            exit(1)
+        end = start + int(window * 1000000) if end is None else min(end, start + int(window * 1000000))
+    return start, end
+
+def resolve_participants(names: Iterable[str], show_participants: List[str], exclude_participants: List[str]) -> Tuple[Optional[Set[str]], Set[str]]:
+    """Resolve the participant filters once to the set of names to show (None for all) and to exclude."""
+    shown = set(show_participants) if show_participants else None
+    excluded = {name for name in names if any(exclude_str in name for exclude_str in exclude_participants)}
+    return shown, excluded
+
+class Schema(NamedTuple):
+    """Adapter from one kind of record to the event format used for rendering."""
+    name: str
+    # Converts a record to an event with the keys timestamp, time_us (time of day in
+    # microseconds or None), sender, receiver (names or None), sender_id, receiver_id,
+    # name (event name or None), signo, seconds, payload and queue_len
+    normalize: Callable[[Any], Dict[str, Any]]
+    # Sender and receiver names are truncated to participant_length and padded to participant_width
+    participant_length: int
+    participant_width: int
+
+def normalize_shipit(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an event from shipit JSON."""
+    return {
+        'timestamp': event.get('sent', event.get('received', 'N/A')),
+        'time_us': time_of_day_us(event.get('sent', event.get('received', ''))),
+        'sender': event.get('sender', {}).get('name'),
+        'receiver': event.get('receiver', {}).get('name'),
+        'sender_id': None,
+        'receiver_id': None,
+        'name': event.get('name'),
+        'signo': 0,
+        'seconds': '',
+        'payload': event.get('payload', ''),
+        'queue_len': event.get('receive_queue_len', 0),
+    }
+
+def normalize_ship_json(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an event from ship.py --json."""
+    if not isinstance(event, dict):
+        print("Error: The events are not a list of objects.")
+        exit(1)
+    return {
+        'timestamp': event.get('timestamp', ''),
+        'time_us': time_of_day_us(event.get('timestamp', '')),
+        'sender': event.get('senderName'),
+        'receiver': event.get('receiverName'),
+        'sender_id': event.get('sender', 0),
+        'receiver_id': event.get('receiver', 0),
+        'name': event.get('signalName'),
+        'signo': event.get('signo', 0),
+        'seconds': event.get('seconds', ''),
+        'payload': '',
+        'queue_len': 0,
+    }
+
+SHIPIT_SCHEMA = Schema('shipit', normalize_shipit, 35, 35)
+SHIP_JSON_SCHEMA = Schema('ship', normalize_ship_json, 30, 25)
+
+def ship_record_schema(mailboxes: Dict[int, str], signals: Dict[int, str]) -> Schema:
+    """Adapter for entries decoded by ship.py, rendered like ship.py --json output."""
+    def normalize(entry: Dict[str, Any]) -> Dict[str, Any]:
+        seconds = entry['seconds'] + entry['microseconds'] / 1e6
+        return {
+            'timestamp': datetime.strftime(datetime.utcfromtimestamp(seconds), '%Y-%m-%d %H:%M:%S.%f'),
+            'time_us': entry['seconds'] % 86400 * 1000000 + entry['microseconds'],
+            'sender': mailboxes.get(entry['sender']),
+            'receiver': mailboxes.get(entry['receiver']),
+            'sender_id': entry['sender'],
+            'receiver_id': entry['receiver'],
+            'name': signals.get(entry['signo']),
+            'signo': entry['signo'],
+            'seconds': seconds,
+            'payload': '',
+            'queue_len': 0,
+        }
+    return Schema('ship', normalize, SHIP_JSON_SCHEMA.participant_length, SHIP_JSON_SCHEMA.participant_width)
+
+def scan_events(events: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, str], Dict[int, str], int, bool]:
+    """Assign colors to participants and signos, calculate the event name width and check if the events are sorted on time, in one pass."""
+    participant_colors: Dict[str, str] = {}
+    signo_colors: Dict[int, str] = {}
+    max_name_length = 0
+    last_time = -1
+    times_sorted = True
+    for event in events:
+        for participant in (event['sender'], event['receiver']):
+            if participant and participant not in participant_colors:
+                participant_colors[participant] = PARTICIPANT_COLORS[len(participant_colors) % len(PARTICIPANT_COLORS)]
+        if event['signo'] not in signo_colors:
+            signo_colors[event['signo']] = SIGNO_COLORS[len(signo_colors) % len(SIGNO_COLORS)]
+        max_name_length = max(max_name_length, len(event['name'] or ''))
+        if event['time_us'] is None or event['time_us'] < last_time:
+            times_sorted = False
+        else:
+            last_time = event['time_us']
+    return participant_colors, signo_colors, max_name_length + 2, times_sorted
+
+def select_time_range(events: Iterable[Dict[str, Any]], start: Optional[int], end: Optional[int], times_sorted: bool) -> Iterable[Dict[str, Any]]:
+    """Select the events at/after start and before end. A list is searched through an index sorted on time, and other sorted events are only read until end."""
+    if isinstance(events, list):
+        index = sorted((event['time_us'], i) for i, event in enumerate(events) if event['time_us'] is not None)
+        times = [t for t, _ in index]
+        lo = bisect.bisect_left(times, start) if start is not None else 0
+        hi = bisect.bisect_left(times, end) if end is not None else len(times)
+        return [events[i] for i in sorted(i for _, i in index[lo:hi])]
+    if times_sorted:
+        if start is not None:
+            events = itertools.dropwhile(lambda event: event['time_us'] < start, events)
+        if end is not None:
+            events = itertools.takewhile(lambda event: event['time_us'] < end, events)
+        return events
+    return (event for event in events
+            if event['time_us'] is not None and (start is None or event['time_us'] >= start) and (end is None or event['time_us'] < end))
+
+def format_payload(payload: Any) -> str:
+    """Format a payload as hex and ASCII if it is a list of bytes, and as colored JSON otherwise."""
+    if isinstance(payload, list) and all(isinstance(i, int) for i in payload):
+        return convert_list_to_hex_and_ascii(payload)
+    return colorize_json(json.dumps(payload))
+
+def print_event(event: Dict[str, Any], schema: Schema, participant_colors: Dict[str, str], signo_colors: Dict[int, str], columns: Set[str], event_name_width: int) -> str:
+    """Print a single event."""
+    sender = truncate_string(event['sender'] or 'N/A', schema.participant_length)
+    receiver = truncate_string(event['receiver'] or 'N/A', schema.participant_length)
+    sender_color = participant_colors.get(event['sender'], COLORS["RESET"])
+    receiver_color = participant_colors.get(event['receiver'], COLORS["RESET"])
+
+    output = f"{COLORS['BOLD']}{event['timestamp']:<30}  {COLORS['RESET']}"
+    if 'id' in columns:
+        output += format_participant(str(event['sender_id']), sender_color, 5)
+    output += format_participant(sender, sender_color, schema.participant_width)
+    if 'id' in columns:
+        output += format_participant(str(event['receiver_id']), receiver_color, 5)
+    output += format_participant(receiver, receiver_color, schema.participant_width)
+    if 'queue' in columns:
+        output += f"{event['queue_len']:<7}  "
+    output += format_event_name(event['name'] or 'N/A', event_name_width)
+    if 'seconds' in columns:
+        output += f"{COLORS['BOLD']}{event['seconds']:<25}  {COLORS['RESET']}"
+    if 'signo' in columns:
+        output += f"{signo_colors.get(event['signo'], COLORS['RESET'])}{event['signo']:<15}  {COLORS['RESET']}"
+    if 'payload' in columns:
+        output += f"{format_payload(event['payload']):<50}"
+    return output
+
+def print_header(schema: Schema, columns: Set[str], event_name_width: int) -> str:
+    """Print the header for the output."""
+    header = f"{COLORS['BOLD']}{'Timestamp':<30}  "
+    if 'id' in columns:
+        header += f"{'ID':<5}  "
+    header += f"{'Sender':<{schema.participant_width}}  "
+    if 'id' in columns:
+        header += f"{'ID':<5}  "
+    header += f"{'Receiver':<{schema.participant_width}}  "
+    if 'queue' in columns:
+        header += f"{'Queue':<7}  "
+    header += f"{'Event Name':<{event_name_width + 6}}  "
+    if 'seconds' in columns:
+        header += f"{'Seconds':<25}  "
+    if 'signo' in columns:
+        header += f"{'Signo':<15}  "
+    if 'payload' in columns:
+        header += f"{'Payload':<60}"
+    header += f"{COLORS['RESET']}"
+    return header
+
+def page_lines(lines: Iterable[str]) -> None:
+    """Write lines to less as they are rendered, or straight to stdout when it is not a terminal."""
+    if not sys.stdout.isatty():
+        try:
+            for line in lines:
+                sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader went away, e.g. head. Keep Python from complaining about the closed stdout at exit.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+
+    # less reads from the pipe only as far as it displays, so the writes below block
+    # until the user scrolls and no more than a screenful ahead is rendered
+    pager = subprocess.Popen(['less', '-SRXNi'], stdin=subprocess.PIPE, universal_newlines=True)
+    try:
+        for line in lines:
+            pager.stdin.write(line + "\n")
+        pager.stdin.close()
+    except (BrokenPipeError, KeyboardInterrupt):
+        # The user quit less, or interrupted reading, before all lines were written
+        try:
+            pager.stdin.close()
+        except BrokenPipeError:
+            pass
+    pager.wait()
+
+def present(read_records: Callable[[], Iterable[Any]], schema: Schema, columns: Set[str], show_participants: List[str], exclude_participants: List[str],
+            truncate_names: bool, filter_time: Optional[str], until_time: Optional[str], window: Optional[float]) -> None:
+    """Filter and page the records returned by read_records, which is called once for a list, and twice for a stream that is not kept in memory."""
+    records = read_records()
+    if isinstance(records, list):
+        events: Iterable[Dict[str, Any]] = [schema.normalize(record) for record in records]
+        scanned = events
+    else:
+        scanned = map(schema.normalize, records)
+        events = map(schema.normalize, read_records())
+
+    participant_colors, signo_colors, event_name_width, times_sorted = scan_events(scanned)
+    if event_name_width > 35 and truncate_names:
+        event_name_width = 35
+
+    if filter_time or until_time or window is not None:
+        events = select_time_range(events, *parse_time_range(filter_time, until_time, window), times_sorted)
+
+    # Participants are given as names, or as mailbox ids
+    shown, excluded = resolve_participants(participant_colors, show_participants, exclude_participants)
+    shown_ids = {int(p) for p in show_participants if p.isdigit()}
+    excluded_ids = {int(p) for p in exclude_participants if p.isdigit()}
+
+    filtered_events = (
+        event for event in events
+            if (shown is None or event['sender'] in shown or event['receiver'] in shown
+                or event['sender_id'] in shown_ids or event['receiver_id'] in shown_ids)
+            and event['sender'] not in excluded and event['receiver'] not in excluded
+            and event['sender_id'] not in excluded_ids and event['receiver_id'] not in excluded_ids
+    )
+
+    # Render the lines lazily, as the pager reads them
+    output_lines = itertools.chain([print_header(schema, columns, event_name_width)],
+                                   (print_event(event, schema, participant_colors, signo_colors, columns, event_name_width) for event in filtered_events))
+    page_lines(output_lines)
+
+def shipit_events(file_name: str) -> List[Dict[str, Any]]:
+    """Load the events of a shipit JSON file."""
+    events = load_json(file_name).get('events', [])
+    if not isinstance(events, list):
+        print("Error: The 'events' key is missing or is not a list.")
+        exit(1)
+    return events
+
+def json_source(file_name: str) -> Tuple[Callable[[], Iterable[Any]], Schema]:
+    """Detect the format of a JSON file. shipit JSON is one object that is loaded whole, while ship.py output is streamed."""
+    try:
+        with open(file_name) as f:
+            first_line = next((line for line in f if line.strip()), '')
+    except FileNotFoundError:
+        print(f"Error: The file '{file_name}' was not found.")
+        exit(1)
+    # An array, or an object per line (NDJSON), is decoded element by element. Any other object
+    # spans lines, and decoding it incrementally would go over it again for every chunk read.
+    first_value = None
+    if first_line.lstrip().startswith('{'):
+        try:
+            first_value = json.loads(first_line)
+        except json.JSONDecodeError:
+            first_value = load_json(file_name)
+            if not (isinstance(first_value, dict) and 'events' in first_value):
+                return (lambda: [first_value]), SHIP_JSON_SCHEMA
+    if isinstance(first_value, dict) and 'events' in first_value:
+        events = first_value['events']
+        if not isinstance(events, list):
+            print("Error: The 'events' key is missing or is not a list.")
+            exit(1)
+        return (lambda: events), SHIPIT_SCHEMA
+    return (lambda: iter_json_events(file_name)), SHIP_JSON_SCHEMA
+
+def is_json_file(file_name: str) -> bool:
+    """Check if a file starts like a JSON array or object."""
+    try:
+        with open(file_name, 'rb') as f:
+            return f.read(64).lstrip()[:1] in (b'[', b'{')
+    except FileNotFoundError:
+        print(f"Error: The file '{file_name}' was not found.")
+        exit(1)
+
+def read_ship_records(files: List[str], mailbox_file: Optional[str], signal_file: Optional[str],
+                      signal_filter: Optional[str], mailbox_filter: Optional[str]) -> Tuple[List[Dict[str, Any]], Schema]:
+    """Decode .ship files with ship.py, with the same name lookup and filters as ship.py."""
+    import ship
+
+    entries = ship.load_entries(files)
+    mailboxes = ship.read_mailboxes(mailbox_file) if mailbox_file else ship.get_mailboxes()
+    signal_file = signal_file or ship.find_signal_file()
+    signals = ship.parse_signals(signal_file) if signal_file else {}
+
+    if signal_filter or mailbox_filter:
+        (alls, _) = ship.filter_ids(signal_filter, ship.get_all_signals(entries), signals)
+        matches = ship.mailbox_matcher(mailbox_filter, ship.get_all_boxes(entries), mailboxes)
+        entries = [e for e in entries if e['signo'] in alls and matches(e['sender'], e['receiver'])]
+    return entries, ship_record_schema(mailboxes, signals)
+
+def main(files: List[str], columns: Set[str], show_participants: List[str], exclude_participants: List[str], truncate_names: bool,
+         filter_time: Optional[str], until_time: Optional[str], window: Optional[float], mailbox_file: Optional[str] = None,
+         signal_file: Optional[str] = None, signal_filter: Optional[str] = None, mailbox_filter: Optional[str] = None) -> None:
+    """Main function to pretty-print events from a JSON file or from .ship files."""
+    if len(files) == 1 and is_json_file(files[0]):
+        read_records, schema = json_source(files[0])
+    else:
+        entries, schema = read_ship_records(files, mailbox_file, signal_file, signal_filter, mailbox_filter)
+        read_records = lambda: entries
+    present(read_records, schema, columns, show_participants, exclude_participants, truncate_names, filter_time, until_time, window)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pretty-print SHIP events from shipit JSON, ship.py JSON or .ship files.")
+    parser.add_argument("files", nargs='+', metavar='FILE', help="A JSON file, or .ship files to decode with ship.py.")
+    parser.add_argument("-d", "--display-participants", type=str, nargs='*', default=[], help="Show events by participants (sender or receiver).")
+    parser.add_argument("-e", "--exclude-participants", type=str, nargs='*', default=[], help="Exclude events by participants.")
+    parser.add_argument("-i", "--id", action="store_true", help="Show sender and receiver IDs.")
+    parser.add_argument("-s", "--seconds", action="store_true", help="Show signal seconds.")
+    parser.add_argument("-g", "--signo", action="store_true", help="Show signo.")
+    parser.add_argument("-p", "--payload", action="store_true", help="Show the payload in the output.")
+    parser.add_argument("-q", "--queue", action="store_true", help="Show the receive queue length in the output.")
+    parser.add_argument("-n", "--truncate-names", action="store_true", help="Truncate event names to max 35.")
+    parser.add_argument("-t", "--timestamp", type=str, help="Filter events at/after specified timestamp in format (HH:MM:SS).")
+    parser.add_argument("-u", "--until", type=str, help="Filter events before specified timestamp in format (HH:MM:SS).")
+    parser.add_argument("-w", "--window", type=float, help="Show events during this many seconds from the -t timestamp.")
+    parser.add_argument("--mailboxes", help="Mailbox list for .ship files, as the output from 'um list'.")
+    parser.add_argument("--signals", help="Signal list for .ship files. Format: 'NAME NUMBER_HEX NUMBER_DEC'.")
+    parser.add_argument("--signal-filter", metavar="FILTER", help="Signal filter for .ship files, as in ship.py.")
+    parser.add_argument("--mailbox-filter", metavar="FILTER", help="Mailbox filter for .ship files, as in ship.py.")
+    parser.add_argument("--no-color", action="store_true", help="Do not color the output, e.g. when it is saved to a file.")
+
+    args = parser.parse_args()
+    if args.no_color:
+        disable_colors()
+
+    columns = {column for column, shown in (('id', args.id), ('seconds', args.seconds), ('signo', args.signo),
+                                            ('payload', args.payload), ('queue', args.queue)) if shown}
+    main(args.files, columns, args.display_participants, args.exclude_participants, args.truncate_names,
+         args.timestamp, args.until, args.window, args.mailboxes, args.signals, args.signal_filter, args.mailbox_filter)
@@ -8,7 +8,24 @@ from datetime import datetime
 import os
 import re
 import glob
+import fnmatch
 import json
+import sqlite3
+import bisect
+import atexit
+import base64
+import itertools
+import shutil
+import time
+import threading
+import http.server
+import urllib.error
+import urllib.parse
+import urllib.request
+from array import array
+from collections import deque
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 
 ITC_SEND = 0
 ITC_RECV = 1
@@ -29,10 +46,155 @@ def convert_hex_data(data):
 def print_stderr(text):
   print(text, file=sys.stderr, flush=True)
 
+# Output lines are collected and written to stdout in batches, instead of a print() per line,
+# and each batch is flushed. A reader that exits early, e.g. head or less, ends the program
+# quietly instead of with a BrokenPipeError.
+OUTPUT_BATCH = 8192
+
+class Output:
+  def __init__(self, batch=OUTPUT_BATCH):
+    self.batch = batch
+    self.pending = []
+
+  def line(self, text=""):
+    self.pending.append(text)
+    if len(self.pending) >= self.batch:
+      self.flush()
+
+  def lines(self, lines):
+    for batch in batches(lines, self.batch):
+      self.pending.extend(batch)
+      if len(self.pending) >= self.batch:
+        self.flush()
+
+  # Writes the pending lines
+  def flush(self):
+    try:
+      if self.pending:
+        sys.stdout.write("\n".join(self.pending) + "\n")
+        self.pending = []
+      sys.stdout.flush()
+    except BrokenPipeError:
+      # Later writes, and the flush at exit, go to /dev/null
+      os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+      self.pending = []
+      exit(0)
+
+out = Output()
+
+# Yields lists of at most n items from iterable
+def batches(iterable, n):
+  batch = []
+  for item in iterable:
+    batch.append(item)
+    if len(batch) == n:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
 def is_text(fn):
     msg = subprocess.Popen(["file", "--mime", fn], stdout=subprocess.PIPE, universal_newlines=True).communicate()[0]
     return "text" in msg or "empty" in msg
 
+# Maximum resident set size of the process so far, in bytes, or None where it is not available
+def max_rss():
+  try:
+    import resource
+  except ImportError:
+    return None
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+# Records wall time, CPU time, calls and entry counts per pipeline stage for --profile.
+# start() ends the current stage and begins the next, and a stage that is started several
+# times, e.g. once per file, is summed. Does nothing unless enabled.
+class Profiler:
+  def __init__(self):
+    self.enabled = False
+    self.stages = {}
+    self.current = None
+    self.hook = None
+
+  def enable(self, hook=None):
+    self.enabled = True
+    self.begin = (time.perf_counter(), time.process_time())
+    self.hook = hook
+    if hook == 'cprofile':
+      import cProfile
+      self.cprofile = cProfile.Profile()
+      self.cprofile.enable()
+    elif hook == 'tracemalloc':
+      import tracemalloc
+      tracemalloc.start()
+
+  def start(self, name):
+    if not self.enabled:
+      return
+    self.stop()
+    if self.hook == 'tracemalloc':
+      import tracemalloc
+      # Not available before Python 3.9, where the peak is the peak so far
+      if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    self.current = (name, time.perf_counter(), time.process_time())
+
+  def stop(self):
+    if not self.enabled or not self.current:
+      return
+    (name, wall, cpu) = self.current
+    stage = self.record(name)
+    stage['wall'] += time.perf_counter() - wall
+    stage['cpu'] += time.process_time() - cpu
+    stage['calls'] += 1
+    stage['max_rss'] = max_rss()
+    if self.hook == 'tracemalloc':
+      import tracemalloc
+      stage['traced_peak'] = max(stage.get('traced_peak', 0), tracemalloc.get_traced_memory()[1])
+    self.current = None
+
+  # Adds to the number of entries handled by the current stage
+  def count(self, entries):
+    if self.enabled and self.current:
+      self.record(self.current[0])['entries'] += entries
+
+  def record(self, name):
+    return self.stages.setdefault(name, {'name': name, 'wall': 0.0, 'cpu': 0.0, 'calls': 0, 'entries': 0, 'max_rss': None})
+
+  # Prints the breakdown to stderr, or writes it as JSON to path
+  def report(self, path):
+    self.stop()
+    if self.hook == 'cprofile':
+      self.cprofile.disable()
+    total = {'wall': time.perf_counter() - self.begin[0], 'cpu': time.process_time() - self.begin[1], 'max_rss': max_rss()}
+    stages = list(self.stages.values())
+    if path and path != '-':
+      with open(path, 'w') as fp:
+        json.dump({'argv': sys.argv, 'stages': stages, 'total': total}, fp, indent=2)
+    else:
+      mb = lambda value: '%.1f MB' % (value / 1e6) if value is not None else '-'
+      fmt = "{:<10} {:>9} {:>9} {:>6} {:>10} {:>10}"
+      print_stderr(fmt.format('# Stage', 'Wall s', 'CPU s', 'Calls', 'Entries', 'Max RSS'))
+      for stage in stages:
+        print_stderr(fmt.format(stage['name'], '%.3f' % stage['wall'], '%.3f' % stage['cpu'], stage['calls'],
+                                stage['entries'], mb(stage['max_rss'])))
+      print_stderr(fmt.format('total', '%.3f' % total['wall'], '%.3f' % total['cpu'], '', '', mb(total['max_rss'])))
+      if self.hook == 'tracemalloc':
+        for stage in stages:
+          print_stderr("# %s traced peak: %s" % (stage['name'], mb(stage.get('traced_peak'))))
+
+    if self.hook == 'cprofile':
+      import pstats
+      if path and path != '-':
+        self.cprofile.dump_stats(path + '.prof')
+      pstats.Stats(self.cprofile, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+    elif self.hook == 'tracemalloc':
+      import tracemalloc
+      print_stderr("# Largest allocations still held")
+      for stat in tracemalloc.take_snapshot().statistics('lineno')[:10]:
+        print_stderr(str(stat))
+
+profiler = Profiler()
+
 # Locates the ship header in the file
 def find_ship_header(f):
   data = f.read(4)
@@ -57,83 +219,372 @@ def find_ship_header(f):
   else:
     return (False, endian, 0)
 
+# The fields of an entry, in the order read_binary has always returned them
+ENTRY_FIELDS = ('type', 'source', 'sender', 'receiver', 'seconds', 'microseconds', 'signo', 'procId', 'connId')
+
+# An entry of an EntryTable. The fields are read as entry['seconds'], like the dicts that
+# were used before (and still are by --serve), and entry['pair'] is the paired
+# entry. Entries are made when they are read from the table, and are not kept by it.
+class Entry:
+  __slots__ = ENTRY_FIELDS + ('table', 'index')
+
+  # Looking up an item is looking up an attribute, without a call to Python code
+  __getitem__ = object.__getattribute__
+
+  @property
+  def pair(self):
+    i = self.table.pair[self.index]
+    if i < 0:
+      raise KeyError('pair')
+    return self.table.paired()[i]
+
+  def __contains__(self, key):
+    return key in ENTRY_FIELDS or (key == 'pair' and self.table.pair[self.index] >= 0)
+
+  def keys(self):
+    return ENTRY_FIELDS + ('pair',) if self.table.pair[self.index] >= 0 else ENTRY_FIELDS
+
+  def get(self, key, default=None):
+    return self[key] if key in self else default
+
+  def __eq__(self, other):
+    return all(self[k] == other[k] for k in ENTRY_FIELDS)
+
+  def to_dict(self):
+    return {k: getattr(self, k) for k in ENTRY_FIELDS}
+
+# Identifies an entry, and its pair, across the Entry objects made for the same row
+def entry_key(e):
+  return (id(e.table), e.index) if isinstance(e, Entry) else id(e)
+
+# Entries stored as one array per field, about 40 bytes per entry instead of a dict of
+# objects. procId and connId are interned, as there are few distinct ones, and pairs are
+# stored as the row of the paired entry, or -1. The row is in the table itself, or in
+# partners if the table was taken from it without the paired entries.
+class EntryTable:
+  TYPECODES = (('type', 'I'), ('source', 'I'), ('sender', 'I'), ('receiver', 'I'), ('seconds', 'i'),
+               ('microseconds', 'i'), ('signo', 'I'), ('procId', 'I'), ('connId', 'I'), ('pair', 'i'))
+
+  def __init__(self):
+    for (name, typecode) in self.TYPECODES:
+      setattr(self, name, array(typecode))
+    self.ids = []
+    self.id_index = {}
+    self.partners = None
+
+  # The table that the rows of the pair column are in
+  def paired(self):
+    return self if self.partners is None else self.partners
+
+  def intern(self, value):
+    i = self.id_index.get(value)
+    if i is None:
+      i = self.id_index[value] = len(self.ids)
+      self.ids.append(value)
+    return i
+
+  def append(self, type, source, sender, receiver, seconds, microseconds, signo, procId, connId):
+    self.type.append(type)
+    self.source.append(source)
+    self.sender.append(sender)
+    self.receiver.append(receiver)
+    self.seconds.append(seconds)
+    self.microseconds.append(microseconds)
+    self.signo.append(signo)
+    self.procId.append(self.intern(procId))
+    self.connId.append(self.intern(connId))
+    self.pair.append(-1)
+
+  # Appends the entries of another table
+  def extend(self, other):
+    offset = len(self)
+    for (name, typecode) in self.TYPECODES[:7]:
+      getattr(self, name).extend(getattr(other, name))
+    ids = [self.intern(value) for value in other.ids]
+    self.procId.extend(map(ids.__getitem__, other.procId))
+    self.connId.extend(map(ids.__getitem__, other.connId))
+    self.pair.extend(i + offset if i >= 0 else -1 for i in other.pair)
+
+  # Returns a copy with only the given rows, in that order. Pairs between the given rows are
+  # kept, and an entry whose pair is not among them is left unpaired. With keep_pairs, all pairs
+  # are kept, as rows of this table (or of its partners).
+  def take(self, rows, keep_pairs=False):
+    table = EntryTable()
+    # One getter gathers the rows of each column in C
+    get = itemgetter(*rows) if len(rows) > 1 else lambda column: [column[i] for i in rows]
+    for (name, typecode) in self.TYPECODES[:-1]:
+      getattr(table, name).extend(get(getattr(self, name)))
+    if keep_pairs or self.partners is not None:
+      table.pair.extend(get(self.pair))
+      table.partners = self.paired()
+    elif max(self.pair, default=-1) < 0:
+      table.pair = array('i', [-1]) * len(rows)
+    else:
+      moved = dict(zip(rows, itertools.count()))
+      table.pair.extend(map(moved.get, get(self.pair), itertools.repeat(-1)))
+    table.ids = self.ids
+    table.id_index = self.id_index
+    return table
+
+  # Returns a copy sorted on time, or the table itself if it already is. Entries with the same
+  # time keep their order.
+  def sorted_by_time(self):
+    times = self.times()
+    if all(a <= b for (a, b) in zip(times, itertools.islice(times, 1, None))):
+      return self
+    return self.take(sorted(range(len(self)), key=times.__getitem__))
+
+  # Returns the times in microseconds since the epoch
+  def times(self):
+    return array('q', (s * 1000000 + us for (s, us) in zip(self.seconds, self.microseconds)))
+
+  def __len__(self):
+    return len(self.seconds)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in range(*i.indices(len(self)))]
+    if i < 0:
+      i += len(self)
+    e = Entry()
+    (e.type, e.source, e.sender, e.receiver, e.seconds, e.microseconds, e.signo) = \
+      (self.type[i], self.source[i], self.sender[i], self.receiver[i], self.seconds[i], self.microseconds[i], self.signo[i])
+    e.procId = self.ids[self.procId[i]]
+    e.connId = self.ids[self.connId[i]]
+    e.table = self
+    e.index = i
+    return e
+
+  def __iter__(self):
+    ids = self.ids
+    for (i, row) in enumerate(zip(self.type, self.source, self.sender, self.receiver, self.seconds,
+                                  self.microseconds, self.signo, self.procId, self.connId)):
+      e = Entry()
+      (e.type, e.source, e.sender, e.receiver, e.seconds, e.microseconds, e.signo, procId, connId) = row
+      e.procId = ids[procId]
+      e.connId = ids[connId]
+      e.table = self
+      e.index = i
+      yield e
+
 ## Reads struct SignalInfo from file
 def read_binary(path, keep_zeros):
   with open(path, 'rb') as f:
     header = find_ship_header(f)
+    table = EntryTable()
     if not header[0]:
       print_stderr("%s is not a valid ship file" % path)
-      return []
-
-    entries = []
+      return table
 
     if header[2] == 1:
       struct_format = header[1] + 'HxxIIIiiII'
       for data in struct.iter_unpack(struct_format, f.read()):
         if data[4] != 0 or keep_zeros: # If timestamp is null, list is not full. Haha, that rhymes.
-          entries.append({'type': data[0], 'source': data[1], 'sender':data[2], \
-                          'receiver':data[3], 'seconds':data[4], \
-                           'microseconds':data[5], 'signo':data[6], 'procId':b'', 'connId':b''})
+          table.append(data[0], data[1], data[2], data[3], data[4], data[5], data[6], b'', b'')
 
     elif header[2] == 2:
-      struct_format = header[1] + 'iiIIIII4s4s'
-      for data in struct.iter_unpack(struct_format, f.read()):
-        if data[0] != 0 or keep_zeros: # If timestamp is null, list is not full. Haha, that rhymes.
-          entries.append({'type': data[3], 'source': data[2], 'sender':data[4], \
-                          'receiver':data[5], 'seconds':data[0], \
-                          'microseconds':data[1], 'signo':data[6], \
-                          'procId':data[7], 'connId':data[8]})
-
-    return entries
-
-def clear_file(path):
+      # All fields of 'iiIIIII4s4s' are 4 bytes, so the file is read as an array of 4 byte
+      # words and each field is every 9th word
+      data = f.read()
+      words = array('I')
+      words.frombytes(data[:len(data) // 36 * 36])
+      raw_ids = (words[7::9], words[8::9])
+      if (header[1] == '<') != (sys.byteorder == 'little'):
+        words.byteswap()
+      seconds = array('i', words[0::9].tobytes())
+      rows = None
+      if not keep_zeros and 0 in seconds: # If timestamp is null, list is not full. Haha, that rhymes.
+        rows = [i for (i, s) in enumerate(seconds) if s != 0]
+
+      columns = {'seconds': seconds, 'microseconds': array('i', words[1::9].tobytes()), 'source': words[2::9],
+                 'type': words[3::9], 'sender': words[4::9], 'receiver': words[5::9], 'signo': words[6::9]}
+      # procId and connId are kept as the bytes in the file
+      for (name, raw) in zip(('procId', 'connId'), raw_ids):
+        columns[name] = array('I', [table.intern(value) for value in raw])
+      table.ids = [value.to_bytes(4, sys.byteorder) for value in table.ids]
+      table.id_index = {value: i for (i, value) in enumerate(table.ids)}
+      for (name, column) in columns.items():
+        setattr(table, name, column)
+      table.pair = array('i', [-1]) * len(seconds)
+      if rows is not None:
+        table = table.take(rows)
+
+    return table
+
+# Writes entries as a version 2 ship file, which read_binary can read back. Used to extract
+# a filtered subset of the rings on the node before transfer.
+def write_binary(path, entries):
+  struct_format = struct.Struct('<iiIIIII4s4s')
+  fp = sys.stdout.buffer if path == '-' else open(path, 'wb')
+  try:
+    fp.write(b'SHIP' + b'\xff\xfe' + struct.pack('<H', 2))
+    for batch in batches(entries, 10000):
+      fp.write(b''.join(struct_format.pack(e['seconds'], e['microseconds'], e['source'], e['type'],
+                                           e['sender'], e['receiver'], e['signo'],
+                                           id_bytes(e['procId']), id_bytes(e['connId'])) for e in batch))
+    fp.flush()
+  except BrokenPipeError:
+    if fp is not sys.stdout.buffer:
+      raise
+    # As in Output.flush, the rest goes to /dev/null
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    exit(0)
+  finally:
+    if fp is not sys.stdout.buffer:
+      fp.close()
+
+# procId/connId as the 4 bytes stored in a ship file. Text input may have them as integers.
+def id_bytes(data):
+  if type(data) == int:
+    return struct.pack('<I' if args.little_endian else '>I', data & 0xffffffff)
+  return data
+
+# Size of the zero writes of --clear, so that clearing never needs a buffer the size of a file
+CLEAR_CHUNK = 1 << 20
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+# Entries after the newest one that --clear --until leaves to the writer of a live file
+CLEAR_GUARD = 4096
+
+# Returns libc fallocate, or None if it is not available (not Linux)
+def get_fallocate():
+  try:
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    fallocate = getattr(libc, 'fallocate64', None) or libc.fallocate
+  except (ImportError, OSError, AttributeError):
+    return None
+  fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+  return fallocate
+
+fallocate = get_fallocate()
+
+# Zeroes length bytes at offset without changing the file size. A hole is punched where the
+# file system supports it, which also frees the space. Otherwise zeroes are written in chunks.
+def zero_range(fd, offset, length):
+  if fallocate and fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length) == 0:
+    return
+  zeros = bytes(min(length, CLEAR_CHUNK))
+  end = offset + length
+  while offset < end:
+    offset += os.pwrite(fd, zeros[:end - offset], offset)
+
+# Clears the signals of a ship file, or with before (seconds since the epoch) only those that were
+# sent before that time. The live writer only ever sees whole entries zeroed, and the entries it
+# is about to overwrite are left alone, see CLEAR_GUARD. Returns the number of bytes cleared.
+def clear_file(path, before=None):
   with open(path, 'r+b') as f:
     header = find_ship_header(f)
     if not header[0]:
       print_stderr("%s is not a valid ship file" % path)
-      return
+      return 0
+
+    fd = f.fileno()
+    offset = f.tell()
+    size = os.fstat(fd).st_size
+    if before is None:
+      zero_range(fd, offset, size - offset)
+      return size - offset
 
-    size = os.stat(path).st_size
-    size = size - f.tell()
-    f.write(b'\x00' * size)
+    if header[2] == 1:
+      entry = struct.Struct(header[1] + 'HxxIIIiiII')
+      time_fields = (4, 5)
+    else:
+      entry = struct.Struct(header[1] + 'iiIIIII4s4s')
+      time_fields = (0, 1)
+    chunk = CLEAR_CHUNK // entry.size * entry.size
+    slots = (size - offset) // entry.size
+
+    def chunks():
+      position = offset
+      while position + entry.size <= size:
+        data = os.pread(fd, min(chunk, (size - position) // entry.size * entry.size), position)
+        if not data:
+          return
+        yield (position, data)
+        position += len(data)
+
+    # A live file is written as a ring, at the slot after the newest entry, so the slots after it
+    # are kept to not race with the writer
+    newest = (0, 0, -1)
+    for (position, data) in chunks():
+      first_slot = (position - offset) // entry.size
+      for (i, fields) in enumerate(entry.iter_unpack(data)):
+        if (fields[time_fields[0]], fields[time_fields[1]]) > newest[:2]:
+          newest = (fields[time_fields[0]], fields[time_fields[1]], first_slot + i)
+    guarded = lambda slot: (slot - newest[2] - 1) % slots < CLEAR_GUARD
+
+    # Zeroes entries start to end of a chunk, unless the writer got to them after all
+    def clear_run(position, data, start, end):
+      run = data[start * entry.size:end * entry.size]
+      if os.pread(fd, len(run), position + start * entry.size) != run:
+        return 0
+      zero_range(fd, position + start * entry.size, len(run))
+      return len(run)
+
+    # Clear runs of old entries, chunk by chunk
+    cleared = 0
+    for (position, data) in chunks():
+      first_slot = (position - offset) // entry.size
+      run_start = None
+      for (i, fields) in enumerate(entry.iter_unpack(data)):
+        seconds = fields[time_fields[0]]
+        t = seconds + fields[time_fields[1]]/1e6
+        old = seconds != 0 and t < before and not guarded(first_slot + i)
+        if old and run_start is None:
+          run_start = i
+        elif not old and run_start is not None:
+          cleared += clear_run(position, data, run_start, i)
+          run_start = None
+      if run_start is not None:
+        cleared += clear_run(position, data, run_start, len(data) // entry.size)
+    return cleared
+
+# Clears the files in parallel. Clearing is I/O bound, so threads are enough.
+def clear_files(files, before=None):
+  with ThreadPoolExecutor(max_workers=min(len(files), 8)) as executor:
+    return sum(executor.map(lambda path: clear_file(path, before), files))
 
 def read_text(path):
-  entries = []
+  entries = EntryTable()
   with open(path) as fp:
-    while True:
-      line = fp.readline()
-      if not line:
-        break
-      line = line.split('#')[0]
-      if not line:
-          continue
-      fields = line.split()
-      timestamp = fields[0].split(".")
-      entry = {'seconds': int(timestamp[0]), 'microseconds': int(timestamp[1]), \
-                      'type': int(fields[1]), 'source': int(fields[2]), 'sender': int(fields[3]), \
-                      'receiver': int(fields[4]), 'signo': int(fields[5], 16)}
-      if len(fields) == 7: # hexdata is present
-        if len(fields[6]) == 32:
-          # They don't make it easy to convert a literal escaped string to the actual bytes..
-          entry['procId'] = ((fields[6])[:int(len(fields[6])/2)]).encode().decode('unicode-escape').encode('latin1')
-          entry['connId'] = ((fields[6])[int(len(fields[6])/2):]).encode().decode('unicode-escape').encode('latin1')
-        else: # handling of bug, reformat from \xffffffhh to \xhh
-          split = fields[6].split("\\x")
-          fixed = [int(f, 16) & int("0xFF", 16) for f in split[1:]]
-          fixed_proc_string = ''.join("\\x%02x" % f for f in fixed[:4])
-          fixed_conn_string = ''.join("\\x%02x" % f for f in fixed[4:])
-          entry['procId'] = fixed_proc_string.encode().decode('unicode-escape').encode('latin1')
-          entry['connId'] = fixed_conn_string.encode().decode('unicode-escape').encode('latin1')
-      elif len(fields) == 8: # two integer is present
-          entry['procId'] = int(fields[6])
-          entry['connId'] = int(fields[7])
-      else: # proc id and conn id is not present
-        entry['procId'] = b''
-        entry['connId'] = b''
-
-      entries.append(entry)
+    for line in fp:
+      entry = parse_text_line(line)
+      if entry:
+        entries.append(entry['type'], entry['source'], entry['sender'], entry['receiver'], entry['seconds'],
+                       entry['microseconds'], entry['signo'], entry['procId'], entry['connId'])
   return entries
 
+# Parses a line of --text or --stream output to an entry. Returns None for empty lines and comments.
+def parse_text_line(line):
+  line = line.split('#')[0]
+  fields = line.split()
+  if not fields:
+    return None
+  timestamp = fields[0].split(".")
+  entry = {'seconds': int(timestamp[0]), 'microseconds': int(timestamp[1]), \
+                  'type': int(fields[1]), 'source': int(fields[2]), 'sender': int(fields[3]), \
+                  'receiver': int(fields[4]), 'signo': int(fields[5], 16)}
+  if len(fields) == 7: # hexdata is present
+    if len(fields[6]) == 32:
+      # They don't make it easy to convert a literal escaped string to the actual bytes..
+      entry['procId'] = ((fields[6])[:int(len(fields[6])/2)]).encode().decode('unicode-escape').encode('latin1')
+      entry['connId'] = ((fields[6])[int(len(fields[6])/2):]).encode().decode('unicode-escape').encode('latin1')
+    else: # handling of bug, reformat from \xffffffhh to \xhh
+      split = fields[6].split("\\x")
+      fixed = [int(f, 16) & int("0xFF", 16) for f in split[1:]]
+      fixed_proc_string = ''.join("\\x%02x" % f for f in fixed[:4])
+      fixed_conn_string = ''.join("\\x%02x" % f for f in fixed[4:])
+      entry['procId'] = fixed_proc_string.encode().decode('unicode-escape').encode('latin1')
+      entry['connId'] = fixed_conn_string.encode().decode('unicode-escape').encode('latin1')
+  elif len(fields) == 8: # two integer is present
+      entry['procId'] = int(fields[6])
+      entry['connId'] = int(fields[7])
+  else: # proc id and conn id is not present
+    entry['procId'] = b''
+    entry['connId'] = b''
+  return entry
+
 # parse output from um list or um trace
 def parse_um(output):
   mailboxes = {}
@@ -189,21 +640,36 @@ def read_mailboxes(path):
     mailboxes = parse_um(fp)
   return mailboxes
 
+def escape_hex_data(data):
+  return "".join("\\x%02x" % i for i in data)
+
+# Formats entries in the raw format provided by GDB in earlier script, as used by --text and
+# --stream. procId and connId of a table are converted once per distinct value.
+def format_text_lines(entries):
+  if args.dont_convert_hex_data:
+    (fmt, convert) = ("%u.%06u %u %u %u %u 0x%x %s%s", escape_hex_data)
+  else:
+    (fmt, convert) = ("%u.%06u %u %u %u %u 0x%x %u %u", convert_hex_data)
+  if isinstance(entries, EntryTable):
+    ids = [convert(data) for data in entries.ids]
+    return (fmt % (seconds, microseconds, kind, source, sender, receiver, signo, ids[procId], ids[connId])
+            for (seconds, microseconds, kind, source, sender, receiver, signo, procId, connId)
+            in zip(entries.seconds, entries.microseconds, entries.type, entries.source, entries.sender,
+                   entries.receiver, entries.signo, entries.procId, entries.connId))
+  return (fmt % (data['seconds'], data['microseconds'], data['type'], data['source'], data['sender'],
+                 data['receiver'], data['signo'], convert(data['procId']), convert(data['connId']))
+          for data in entries)
+
 # Print output in the raw format provided by GDB in earlier script
 def print_ship_entries_text(entries):
-  for data in entries:
-    if args.dont_convert_hex_data:
-      print("%u.%06u %u %u %u %u 0x%x %s%s" % (data['seconds'], data['microseconds'], data['type'], \
-                                               data['source'], data['sender'], data['receiver'], \
-                                               data['signo'], "".join("\\x%02x" % i for i in data['procId']), \
-                                               "".join("\\x%02x" % i for i in data['connId'])))
-    else:
-      print("%u.%06u %u %u %u %u 0x%x %u %u" % (data['seconds'], data['microseconds'], data['type'], \
-                                                data['source'], data['sender'], data['receiver'], \
-                                                data['signo'], convert_hex_data(data['procId']), convert_hex_data(data['connId'])))
+  out.lines(format_text_lines(entries))
+  out.flush()
 
 # Get all mailboxes beloning to this lm
 def get_local_boxes(entries):
+  if isinstance(entries, EntryTable):
+    return set(s if t == ITC_SEND else r for (t, s, r) in zip(entries.type, entries.sender, entries.receiver)
+               if t in (ITC_SEND, ITC_RECV))
   boxes = set()
   for i in entries:
       if i['type'] == ITC_SEND:
@@ -213,6 +679,8 @@ def get_local_boxes(entries):
   return boxes
 
 def get_all_boxes(entries):
+  if isinstance(entries, EntryTable):
+    return set(entries.sender) | set(entries.receiver)
   boxes = set()
   for entry in entries:
     boxes.add(entry['sender'])
@@ -220,103 +688,131 @@ def get_all_boxes(entries):
   return boxes
 
 def get_all_signals(entries):
+  if isinstance(entries, EntryTable):
+    return set(entries.signo)
   return set( d['signo'] for d in entries )
 
-def pair_key(entry):
-  return (entry['signo'], entry['sender'], entry['receiver'], entry['procId'], entry['connId'])
+# Pairs each TX entry with its RX entry in an EntryTable sorted on time
+def find_pairs(entries):
+  times = entries.times()
+  pair = entries.pair
+  columns = (entries.type, entries.signo, entries.sender, entries.receiver, entries.procId, entries.connId)
+
+  # Setup a look-up table of all RX signals, latest first,
+  # indexed on (signo, sender, receiver, data)
+  rx_map = {}
+  for (i, kind, signo, sender, receiver, procId, connId) in zip(itertools.count(), *columns):
+    if kind == ITC_RECV:
+      key = (signo, sender, receiver, procId, connId)
+      rows = rx_map.get(key)
+      if rows is None:
+        rows = rx_map[key] = array('L')
+      rows.append(i)
+  for rows in rx_map.values():
+    rows.reverse()
+
+  # For each TX signal, select the first matching RX that is not already claimed
+  # by another TX, and where TX timestamp < RX timestamp. TX signals are visited
+  # in time order, so an RX that is claimed or too early for one TX can never pair
+  # with a later TX, and is dropped from the end of the candidates.
+  for (i, kind, signo, sender, receiver, procId, connId) in zip(itertools.count(), *columns):
+    if kind != ITC_SEND:
+      continue
+    candidates = rx_map.get((signo, sender, receiver, procId, connId))
+    if not candidates:
+      continue
+    sent = times[i]
+    while candidates and (pair[candidates[-1]] >= 0 or times[candidates[-1]] <= sent):
+      candidates.pop()
+    if candidates:
+      j = candidates.pop()
+      pair[i] = j
+      pair[j] = i
 
-def is_pair(rx, tx):
-  if not 'pair' in rx.keys():
-    sent = tx['seconds'] + tx['microseconds']/1e6
-    received = rx['seconds'] + rx['microseconds']/1e6
-    return sent < received
-  else:
-      return False
 
-def find_pairs(entries):
-  tx = [i for i in entries if i['type'] == ITC_SEND]
-  rx = [i for i in entries if i['type'] == ITC_RECV]
-
-  # Setup a look-up table of all RX signals,
-  # indexed on (signo, receiver, sender, data)
-  rx_keys = set([pair_key(i) for i in entries])
-  rx_map = {i:[] for i in rx_keys}
-  for entry in rx:
-    rx_map[pair_key(entry)].append(entry)
-
-  # For each TX signal, check all matching RX, and also check
-  # if already claimed by another TX, and that TX timestamp < RX timestamp.
-  # Select first match
-  for entry in tx:
-    possible_pairs = [i for i in rx_map[pair_key(entry)] if is_pair(i, entry)]
-    if possible_pairs:
-      entry['pair'] = possible_pairs[0]
-      possible_pairs[0]['pair'] = entry
-
-
-# Removes internal send events to prevent duplicates
+# Removes internal send events to prevent duplicates. A table keeps its columns, and the pairs of
+# its TX entries refer to the RX entries in the given table.
 def filter_duplicates(entries):
-  return [i for i in entries if i['type'] == ITC_SEND or 'pair' not in i.keys()]
+  if isinstance(entries, EntryTable):
+    return entries.take([i for (i, (kind, pair)) in enumerate(zip(entries.type, entries.pair))
+                         if kind == ITC_SEND or pair < 0], True)
+  return [i for i in entries if i['type'] == ITC_SEND or 'pair' not in i]
+
 
+# Yields (seconds, microseconds, type, sender, receiver, signo, procId, connId, queue time or None)
+# for the entries without duplicates, read from the columns of a table
+def csv_rows(entries):
+  if not isinstance(entries, EntryTable):
+    for data in filter_duplicates(entries):
+      try:
+        pair = data['pair']
+        queue_time = pair['seconds'] + pair['microseconds']/1e6 - (data['seconds'] + data['microseconds']/1e6)
+      except KeyError:
+        queue_time = None
+      yield (data['seconds'], data['microseconds'], data['type'], data['sender'], data['receiver'], data['signo'],
+             data['procId'], data['connId'], queue_time)
+    return
+
+  (seconds, microseconds) = (entries.paired().seconds, entries.paired().microseconds)
+  ids = entries.ids
+  for row in zip(entries.seconds, entries.microseconds, entries.type, entries.sender, entries.receiver, entries.signo,
+                 entries.procId, entries.connId, entries.pair):
+    pair = row[8]
+    if pair < 0:
+      queue_time = None
+    elif row[2] == ITC_SEND:
+      queue_time = seconds[pair] + microseconds[pair]/1e6 - (row[0] + row[1]/1e6)
+    else:
+      continue
+    yield row[:6] + (ids[row[6]], ids[row[7]], queue_time)
 
 # Prints CSV format of ship data
 def print_ship_entries(entries, mailboxes, signals):
-  print("time, direction, queue_time, from_msgboxId, from_name, to_msgboxId, to_name, signalNumber, signalName, procId, connId")
-  entries = filter_duplicates(entries)
-  for data in entries:
+  out.line("time, direction, queue_time, from_msgboxId, from_name, to_msgboxId, to_name, signalNumber, signalName, procId, connId")
 
-    try:
-      sender = mailboxes[data['sender']]
-    except KeyError:
-      sender = '<unknown>'
-
-    try:
-      receiver = mailboxes[data['receiver']]
-    except KeyError:
-      receiver = '<unknown>'
-
-    try:
-      signal = signals[data['signo']]
-    except KeyError:
-      signal = '<unknown>'
-
-    timestamp = datetime.strftime(datetime.utcfromtimestamp(data['seconds']+data['microseconds']/1e6), '%Y-%m-%d %H:%M:%S.%f')
+  if args.dont_convert_hex_data:
+    fmt = "%s, %s, %s, %u, %s, %u, %s, 0x%x, %s, {%s %s}"
+    convert = lambda data: " ".join("%02x" % i for i in data)
+  else:
+    fmt = "%s, %s, %s, %u, %s, %u, %s, 0x%x, %s, %u, %u"
+    convert = convert_hex_data
+
+  # Many entries share the same second and procId/connId, so these are formatted once
+  dates = {}
+  ids = {}
+
+  def lines():
+    for (seconds, microseconds, kind, sender, receiver, signo, procId, connId, queue_time) in csv_rows(entries):
+      if 0 <= microseconds < 1000000:
+        date = dates.get(seconds)
+        if date is None:
+          date = dates[seconds] = datetime.strftime(datetime.utcfromtimestamp(seconds), '%Y-%m-%d %H:%M:%S')
+        timestamp = "%s.%06u" % (date, microseconds)
+      else:
+        timestamp = datetime.strftime(datetime.utcfromtimestamp(seconds + microseconds/1e6), '%Y-%m-%d %H:%M:%S.%f')
 
-    if data['type'] == ITC_SEND:
-      direction = "S"
-    else:
-      direction = "R"
+      if procId not in ids:
+        ids[procId] = convert(procId)
+      if connId not in ids:
+        ids[connId] = convert(connId)
 
-    try:
-      pair = data['pair']
-      diff = pair['seconds'] + pair['microseconds']/1e6 - (data['seconds'] + data['microseconds']/1e6)
-      queue_time = "%+.6f" % diff
-    except KeyError:
-      queue_time = "<unknown>"
+      yield fmt % (timestamp,
+                   "S" if kind == ITC_SEND else "R",
+                   "%+.6f" % queue_time if queue_time is not None else "<unknown>",
+                   sender, mailboxes.get(sender, '<unknown>'),
+                   receiver, mailboxes.get(receiver, '<unknown>'),
+                   signo, signals.get(signo, '<unknown>'),
+                   ids[procId], ids[connId])
 
-    if args.dont_convert_hex_data:
-      print("%s, %s, %s, %u, %s, %u, %s, 0x%x, %s, {%s %s}" % (timestamp,
-                                                               direction,
-                                                               queue_time,
-                                                               data['sender'], sender,
-                                                               data['receiver'], receiver,
-                                                               data['signo'], signal,
-                                                               " ".join("%02x" % i for i in data['procId']),
-                                                               " ".join("%02x" % i for i in data['connId'])))
-    else:
-      print("%s, %s, %s, %u, %s, %u, %s, 0x%x, %s, %u, %u" % (timestamp,
-                                                              direction,
-                                                              queue_time,
-                                                              data['sender'], sender,
-                                                              data['receiver'], receiver,
-                                                              data['signo'], signal,
-                                                              convert_hex_data(data['procId']),
-                                                              convert_hex_data(data['connId'])))
+  out.lines(lines())
+  out.flush()
 
 def print_json(entries, mailboxes, signals):
-  for data in entries:
-    # Avoid infinite recursion caused by pairs referencing each other
-    data.pop('pair', 0)
+  output = []
+  for e in entries:
+    # Pairs are left out, as they reference each other
+    data = {k: e[k] for k in ENTRY_FIELDS}
+    output.append(data)
 
     try:
       data['senderName'] = mailboxes[data['sender']]
@@ -344,37 +840,38 @@ def print_json(entries, mailboxes, signals):
       data['procId'] = convert_hex_data(data['procId'])
       data['connId'] = convert_hex_data(data['connId'])
 
-  print(json.dumps(entries, indent=2))
+  out.line(json.dumps(output, indent=2))
+  out.flush()
 
 def print_uml(entries, mailboxes, signals):
   entries = filter_duplicates(entries)
   local_boxes = get_local_boxes(entries)
   all_boxes = get_all_boxes(entries)
 
-  print("@startuml")
-  print("skinparam defaultFontName Consolas")
-  print("skinparam defaultFontSize 14")
-  print("skinparam backgroundColor white")
-  print("skinparam arrowColor darkred")
-  print("box \"Application\"")
+  out.line("@startuml")
+  out.line("skinparam defaultFontName Consolas")
+  out.line("skinparam defaultFontSize 14")
+  out.line("skinparam backgroundColor white")
+  out.line("skinparam arrowColor darkred")
+  out.line("box \"Application\"")
   for box in local_boxes:
     if box in mailboxes.keys():
-      print("participant \"%s\\n%u\" as %u" % (mailboxes[box], box, box))
+      out.line("participant \"%s\\n%u\" as %u" % (mailboxes[box], box, box))
     else:
-      print("participant " + str(box))
-  print("end box")
+      out.line("participant " + str(box))
+  out.line("end box")
 
-  print("")
+  out.line("")
 
   for box in all_boxes:
     if box not in local_boxes:
       if box in mailboxes.keys():
-        print("participant \"%s\\n%u\" as %u" % (mailboxes[box], box, box))
+        out.line("participant \"%s\\n%u\" as %u" % (mailboxes[box], box, box))
       else:
-        print("participant " + str(box))
+        out.line("participant " + str(box))
 
-  print("")
-  print("")
+  out.line("")
+  out.line("")
 
   last_time = 0
   if len(entries) > 0:
@@ -384,7 +881,7 @@ def print_uml(entries, mailboxes, signals):
 
     diff = entry['seconds'] - last_time
     if diff > 1:
-      print("...%u second(s) passed..." % diff)
+      out.line("...%u second(s) passed..." % diff)
     last_time = entry['seconds']
 
     try:
@@ -392,58 +889,442 @@ def print_uml(entries, mailboxes, signals):
     except KeyError:
       signal = "0x%x" % entry['signo']
     isig=signal.upper()
-    print("%u %s%s%s %u :  %s "  % (entry['sender'],
-                                    "--" if isig.endswith("CFM") or isig.endswith("REJ") or isig.endswith("_R")
-                                            or isig.endswith("ACK") or isig.endswith("REPLY") or isig.endswith("RSP")
-                                            else "-",
-                                    "[#red]" if isig.endswith("REJ") else "",
-                                    ">>" if isig.endswith("IND") or isig.endswith("FWD")
-                                            else ">",
-                                    entry['receiver'],
-                                    signal))
-
-
-  print("== Memory was dumped! ==")
-  print("@enduml")
+    out.line("%u %s%s%s %u :  %s "  % (entry['sender'],
+                                       "--" if isig.endswith("CFM") or isig.endswith("REJ") or isig.endswith("_R")
+                                               or isig.endswith("ACK") or isig.endswith("REPLY") or isig.endswith("RSP")
+                                               else "-",
+                                       "[#red]" if isig.endswith("REJ") else "",
+                                       ">>" if isig.endswith("IND") or isig.endswith("FWD")
+                                               else ">",
+                                       entry['receiver'],
+                                       signal))
+
+
+  out.line("== Memory was dumped! ==")
+  out.line("@enduml")
+  out.flush()
+
+# Aggregates entries in a single pass. Returns a dict with the overall 'count', 'first'
+# and 'last' times, and statistics per signal number ('signals'), per mailbox ('mailboxes')
+# and per (sender, receiver) edge ('edges'). Signal and edge statistics hold 'count', 'first',
+# 'last' and 'queue', an array of queue times in seconds for the entries that have a pair.
+# Mailbox statistics hold 'sent', 'received', 'first' and 'last'.
+def aggregate(entries):
+  result = {'count': 0, 'first': None, 'last': None, 'signals': {}, 'mailboxes': {}, 'edges': {}}
+  signal_stats = result['signals']
+  mailbox_stats = result['mailboxes']
+  edge_stats = result['edges']
+
+  for (t, signo, sender, receiver, queue_time) in aggregate_rows(entries):
+    for (stats_map, key) in ((signal_stats, signo), (edge_stats, (sender, receiver))):
+      stats = stats_map.get(key)
+      if stats is None:
+        stats = stats_map[key] = {'count': 0, 'first': t, 'last': t, 'queue': array('d')}
+      stats['count'] += 1
+      stats['first'] = min(stats['first'], t)
+      stats['last'] = max(stats['last'], t)
+      if queue_time is not None:
+        stats['queue'].append(queue_time)
+
+    for box in (sender, receiver):
+      stats = mailbox_stats.get(box)
+      if stats is None:
+        stats = mailbox_stats[box] = {'sent': 0, 'received': 0, 'first': t, 'last': t}
+      stats['first'] = min(stats['first'], t)
+      stats['last'] = max(stats['last'], t)
+    mailbox_stats[sender]['sent'] += 1
+    mailbox_stats[receiver]['received'] += 1
+
+    result['count'] += 1
+    if result['first'] is None or t < result['first']:
+      result['first'] = t
+    if result['last'] is None or t > result['last']:
+      result['last'] = t
+  return result
+
+# Yields (time, signo, sender, receiver, queue time or None) of the entries, read from the columns
+# of a table
+def aggregate_rows(entries):
+  if not isinstance(entries, EntryTable):
+    for e in entries:
+      t = e['seconds']+e['microseconds']/1e6
+      if 'pair' in e:
+        pair = e['pair']
+        queue_time = pair['seconds'] + pair['microseconds']/1e6 - t
+      else:
+        queue_time = None
+      yield (t, e['signo'], e['sender'], e['receiver'], queue_time)
+    return
+
+  (seconds, microseconds) = (entries.paired().seconds, entries.paired().microseconds)
+  for (s, us, signo, sender, receiver, pair) in zip(entries.seconds, entries.microseconds, entries.signo,
+                                                    entries.sender, entries.receiver, entries.pair):
+    t = s + us/1e6
+    yield (t, signo, sender, receiver, seconds[pair] + microseconds[pair]/1e6 - t if pair >= 0 else None)
+
+# Returns the p:th percentile (0-100) of an already sorted sequence
+def percentile(values, p):
+  if len(values) == 0:
+    return None
+  return values[min(len(values) - 1, int(len(values) * p / 100))]
 
 # Output two tables with all data grouped on signal id and mailbox id, respectively,
 # with total counts and time of first/last event.
 def print_summary(entries, mailboxes, signals):
   entries = filter_duplicates(entries)
+  stats = aggregate(entries)
 
-  alls = get_all_signals(entries)
+  alls = stats['signals']
   length=max( (len(signals[s]) if s in signals else 9) for s in alls )+1
   fmt="{0:<10} {1:<{5}} {2:<5} {3:<27} {4}"
-  print(fmt.format("# Signal", "Name", "Count", "First", "Last", length))
+  out.line(fmt.format("# Signal", "Name", "Count", "First", "Last", length))
   for signo in sorted(alls, key=lambda s: (1,signals[s].upper()) if s in signals else (2,s)):
-    print(fmt.format("0x{0:07x}".format(signo),
-                     signals[signo] if signo in signals else "<unknown>",
-                     sum( 1 for e in entries if e['signo'] == signo ),
-                     datetime.strftime( datetime.utcfromtimestamp(
-                       min( e['seconds']+e['microseconds']/1e6 for e in entries if e['signo'] == signo )),
-                       '%Y-%m-%d %H:%M:%S.%f'),
-                     datetime.strftime( datetime.utcfromtimestamp(
-                       max( e['seconds']+e['microseconds']/1e6 for e in entries if e['signo'] == signo )),
-                       '%m-%d %H:%M:%S.%f'),
-                     length))
-
-  allm = get_all_boxes(entries)
+    out.line(fmt.format("0x{0:07x}".format(signo),
+                        signals[signo] if signo in signals else "<unknown>",
+                        alls[signo]['count'],
+                        datetime.strftime( datetime.utcfromtimestamp(alls[signo]['first']), '%Y-%m-%d %H:%M:%S.%f'),
+                        datetime.strftime( datetime.utcfromtimestamp(alls[signo]['last']), '%m-%d %H:%M:%S.%f'),
+                        length))
+
+  allm = stats['mailboxes']
   length=max( (len(mailboxes[m]) if m in mailboxes else 9) for m in allm )+1
   fmt="{0:<10} {1:<{6}} {2:<5} {3:<9} {4:<27} {5}"
-  print()
-  print(fmt.format("# Mailbox", "Name", "Sent", "Received", "First", "Last", length))
+  out.line()
+  out.line(fmt.format("# Mailbox", "Name", "Sent", "Received", "First", "Last", length))
   for box in sorted(allm, key=lambda b: (1,mailboxes[b].upper()) if b in mailboxes else (2,b)):
-    print(fmt.format(box,
-                     mailboxes[box] if box in mailboxes else "<unknown>",
-                     sum(1 for e in entries if e['sender'] == box),
-                     sum(1 for e in entries if e['receiver'] == box),
-                     datetime.strftime( datetime.utcfromtimestamp(
-                       min( (e['seconds']+e['microseconds']/1e6 for e in entries if e['sender'] == box or e['receiver'] == box), default=0 )),
-                       '%Y-%m-%d %H:%M:%S.%f'),
-                     datetime.strftime( datetime.utcfromtimestamp(
-                       max( (e['seconds']+e['microseconds']/1e6 for e in entries if e['sender'] == box or e['receiver'] == box), default=0 )),
-                       '%m-%d %H:%M:%S.%f'),
-                     length))
+    out.line(fmt.format(box,
+                        mailboxes[box] if box in mailboxes else "<unknown>",
+                        allm[box]['sent'],
+                        allm[box]['received'],
+                        datetime.strftime( datetime.utcfromtimestamp(allm[box]['first']), '%Y-%m-%d %H:%M:%S.%f'),
+                        datetime.strftime( datetime.utcfromtimestamp(allm[box]['last']), '%m-%d %H:%M:%S.%f'),
+                        length))
+  out.flush()
+
+# Relative change from a to b, as a fraction of a. None if a is zero.
+def relative_change(a, b):
+  if a == 0:
+    return None
+  return (b - a) / a
+
+def format_change(a, b):
+  if a == 0 and b == 0:
+    return "0%"
+  if a == 0:
+    return "new"
+  if b == 0:
+    return "gone"
+  return "%+.0f%%" % (relative_change(a, b) * 100)
+
+# Symmetric size of a change, 0 for none and 1 for appearing or disappearing,
+# used to rank changes in both directions
+def change_score(a, b):
+  if a == b:
+    return 0
+  return abs(b - a) / max(abs(a), abs(b))
+
+def format_queue_time(value):
+  return "-" if value is None else "%.3f" % (value * 1000)
+
+# Aggregates one dump for --compare. The dump is a .ship file or a directory of them.
+# Only the aggregate is kept so that the decoded entries can be freed before the next dump is read.
+def aggregate_dump(path, mailboxes, signals):
+  if os.path.isdir(path):
+    files = sorted(glob.glob(os.path.join(path, "**", "*.ship"), recursive=True) +
+                   glob.glob(os.path.join(path, "**", "*.whip"), recursive=True))
+  else:
+    files = [path]
+  if len(files) == 0:
+    print_stderr("No ship files found in %s!" % path)
+    exit(1)
+
+  data = load_entries(files)
+  if filters_given():
+    data = apply_filters(data, mailboxes, signals)
+  stats = aggregate(filter_duplicates(data))
+  for s in list(stats['signals'].values()) + list(stats['edges'].values()):
+    s['queue'] = array('d', sorted(s['queue']))
+  print_stderr("Read %u signals from %u file(s) in %s" % (stats['count'], len(files), path))
+  return stats
+
+# Compares two dumps with the same aggregation as --summary, and reports the largest changes in
+# signal and edge rates, and in signal queue times. Rates are counts per second of dump duration,
+# so that dumps covering different time spans can be compared.
+def print_compare(path_a, path_b, mailboxes, signals):
+  a = aggregate_dump(path_a, mailboxes, signals)
+  b = aggregate_dump(path_b, mailboxes, signals)
+  duration_a = max((a['last'] or 0) - (a['first'] or 0), 1e-6)
+  duration_b = max((b['last'] or 0) - (b['first'] or 0), 1e-6)
+  top = args.compare_top
+
+  signal_name = lambda s: signals[s] if s in signals else "0x%x" % s
+  box_name = lambda m: mailboxes[m] if m in mailboxes else str(m)
+
+  out.line("# A: %s, %u signals in %.3fs" % (path_a, a['count'], duration_a))
+  out.line("# B: %s, %u signals in %.3fs" % (path_b, b['count'], duration_b))
+
+  for (title, key_name, stats_a, stats_b) in (("Signal", signal_name, a['signals'], b['signals']),
+                                              ("Edge", lambda e: box_name(e[0]) + " -> " + box_name(e[1]),
+                                               a['edges'], b['edges'])):
+    rows = []
+    for key in set(stats_a) | set(stats_b):
+      count_a = stats_a[key]['count'] if key in stats_a else 0
+      count_b = stats_b[key]['count'] if key in stats_b else 0
+      rate_a = count_a / duration_a
+      rate_b = count_b / duration_b
+      rows.append((change_score(rate_a, rate_b), abs(count_b - count_a), key_name(key),
+                   count_a, count_b, rate_a, rate_b))
+    rows.sort(key=lambda r: (-r[0], -r[1], r[2]))
+
+    length = max([len(r[2]) for r in rows[:top]] + [len(title) + 7]) + 1
+    fmt = "{0:<{7}} {1:<9} {2:<9} {3:<10} {4:<10} {5:<7} {6}"
+    out.line()
+    out.line(fmt.format("# " + title + " rate", "Count A", "Count B", "Rate/s A", "Rate/s B", "Change", "", length).rstrip())
+    for r in rows[:top]:
+      out.line(fmt.format(r[2], r[3], r[4], "%.2f" % r[5], "%.2f" % r[6], format_change(r[5], r[6]), "", length).rstrip())
+
+  rows = []
+  for signo in set(a['signals']) & set(b['signals']):
+    queue_a = a['signals'][signo]['queue']
+    queue_b = b['signals'][signo]['queue']
+    if len(queue_a) == 0 or len(queue_b) == 0:
+      continue
+    p50 = (percentile(queue_a, 50), percentile(queue_b, 50))
+    p99 = (percentile(queue_a, 99), percentile(queue_b, 99))
+    rows.append((max(change_score(*p50), change_score(*p99)), signal_name(signo), p50, p99))
+  rows.sort(key=lambda r: (-r[0], r[1]))
+
+  length = max([len(r[1]) for r in rows[:top]] + [24]) + 1
+  fmt = "{0:<{7}} {1:<9} {2:<9} {3:<7} {4:<9} {5:<9} {6}"
+  out.line()
+  out.line(fmt.format("# Signal queue time (ms)", "p50 A", "p50 B", "Change", "p99 A", "p99 B", "Change", length))
+  for r in rows[:top]:
+    out.line(fmt.format(r[1],
+                        format_queue_time(r[2][0]), format_queue_time(r[2][1]), format_change(*r[2]),
+                        format_queue_time(r[3][0]), format_queue_time(r[3][1]), format_change(*r[3]),
+                        length))
+  out.flush()
+
+# Splits a signal name into procedure and role, e.g. A4CI_DATA_REQ -> ('A4CI_DATA', 'REQ').
+# Trailing digits are part of the procedure, so FOO_REQ2 is answered by FOO_CFM2.
+TRANSACTION_PATTERN = re.compile(r"^(.+)_(REQ|CFM|REJ|IND|RSP)(\d*)$", re.IGNORECASE)
+TRANSACTION_REQUESTS = {'REQ': ('CFM', 'REJ'), 'IND': ('RSP',)}
+TRANSACTION_REPLIES = {'CFM': 'REQ', 'REJ': 'REQ', 'RSP': 'IND'}
+
+# Matches each *_REQ with its *_CFM/*_REJ (and each *_IND with its *_RSP) going back between the same
+# two mailboxes. A reply with the same procId/connId as the request is preferred; otherwise the oldest
+# outstanding request between the mailboxes is used. Entries must be sorted on time, without duplicates.
+# Returns {procedure: {'requests', 'confirmed', 'rejected', 'timeouts', 'pending', 'orphans', 'latency'}}
+# where 'latency' is an array of request-sent to reply-received times in seconds.
+def find_transactions(entries, signals, timeout):
+  procedures = {}
+  exact = {}   # (procedure, requester, responder, procId, connId) -> outstanding requests
+  loose = {}   # (procedure, requester, responder) -> outstanding requests
+  last_time = 0
+
+  for e in entries:
+    if e['signo'] not in signals:
+      continue
+    m = TRANSACTION_PATTERN.match(signals[e['signo']])
+    if not m:
+      continue
+    role = m.group(2).upper()
+    procedure = m.group(1) + m.group(3)
+    sent = e['seconds'] + e['microseconds']/1e6
+    last_time = max(last_time, sent)
+
+    stats = procedures.get(procedure)
+    if stats is None:
+      stats = procedures[procedure] = {'requests': 0, 'confirmed': 0, 'rejected': 0, 'timeouts': 0,
+                                       'pending': 0, 'orphans': 0, 'latency': array('d')}
+
+    if role in TRANSACTION_REQUESTS:
+      stats['requests'] += 1
+      request = [sent, False]
+      exact.setdefault((procedure, e['sender'], e['receiver'], e['procId'], e['connId']), deque()).append(request)
+      loose.setdefault((procedure, e['sender'], e['receiver']), deque()).append(request)
+      continue
+
+    # Replies go back from the responder to the requester
+    request = None
+    for (table, key) in ((exact, (procedure, e['receiver'], e['sender'], e['procId'], e['connId'])),
+                         (loose, (procedure, e['receiver'], e['sender']))):
+      outstanding = table.get(key)
+      while outstanding and outstanding[0][1]:
+        outstanding.popleft()
+      if outstanding:
+        request = outstanding.popleft()
+        break
+    if request is None:
+      stats['orphans'] += 1
+      continue
+
+    request[1] = True
+    if 'pair' in e:
+      received = e['pair']['seconds'] + e['pair']['microseconds']/1e6
+    else:
+      received = sent
+    latency = received - request[0]
+    if latency > timeout:
+      stats['timeouts'] += 1
+      continue
+    stats['latency'].append(latency)
+    if role == 'REJ':
+      stats['rejected'] += 1
+    else:
+      stats['confirmed'] += 1
+
+  # Unanswered requests are timeouts, unless the dump ended before their timeout expired
+  for (key, outstanding) in loose.items():
+    for request in outstanding:
+      if not request[1]:
+        if last_time - request[0] > timeout:
+          procedures[key[0]]['timeouts'] += 1
+        else:
+          procedures[key[0]]['pending'] += 1
+  return procedures
+
+# Output one row per procedure with request count, confirm/reject/timeout counts,
+# reject rate and the latency from request to reply.
+def print_transactions(entries, mailboxes, signals):
+  entries = filter_duplicates(entries)
+  procedures = find_transactions(entries, signals, args.transaction_timeout)
+  procedures = {p: s for p, s in procedures.items() if s['requests'] > 0 or s['orphans'] > 0}
+  if len(procedures) == 0:
+    print_stderr("No request/reply signals found. Signal names are needed, see --signals.")
+    exit(1)
+
+  length = max(len(p) for p in procedures) + 1
+  fmt = "{0:<{11}} {1:<8} {2:<8} {3:<8} {4:<8} {5:<8} {6:<8} {7:<7} {8:<9} {9:<9} {10}"
+  out.line(fmt.format("# Procedure", "Requests", "Confirm", "Reject", "Timeout", "Pending", "Orphan", "Reject%",
+                      "p50 ms", "p99 ms", "max ms", length))
+  for procedure in sorted(procedures, key=str.upper):
+    stats = procedures[procedure]
+    latency = sorted(stats['latency'])
+    answered = stats['confirmed'] + stats['rejected'] + stats['timeouts']
+    out.line(fmt.format(procedure,
+                        stats['requests'], stats['confirmed'], stats['rejected'], stats['timeouts'],
+                        stats['pending'], stats['orphans'],
+                        "%.1f" % (100.0 * stats['rejected'] / answered) if answered else "-",
+                        format_queue_time(percentile(latency, 50)),
+                        format_queue_time(percentile(latency, 99)),
+                        format_queue_time(latency[-1] if latency else None),
+                        length))
+  out.flush()
+
+# Parses a bucket size such as "1", "0.5s", "100ms" or "2m" into seconds
+def parse_bucket(text):
+  m = re.match(r"^\s*(\d+(?:\.\d*)?|\.\d+)\s*(us|ms|s|m|h)?\s*$", text)
+  if not m or float(m.group(1)) <= 0:
+    raise argparse.ArgumentTypeError("invalid bucket size '%s', expected e.g. 1, 0.5s, 100ms or 2m" % text)
+  scale = {'us': 1e-6, 'ms': 1e-3, 's': 1, 'm': 60, 'h': 3600}[m.group(2) or 's']
+  return float(m.group(1)) * scale
+
+# Bins entries into fixed intervals of `bucket` seconds in a single pass, keyed on
+# signal number (by='signal') or mailbox (by='mailbox', counting both sent and received).
+# Returns (start time of first bucket, number of buckets, {bucket index: total count},
+#          {key: {bucket index: count}})
+def bucket_entries(entries, bucket, by):
+  totals = {}
+  bins = {}
+  if len(entries) == 0:
+    return (0, 0, totals, bins)
+
+  start = min(e['seconds'] for e in entries)
+  last = 0
+  for e in entries:
+    i = int((e['seconds'] - start + e['microseconds']/1e6) / bucket)
+    if i > last:
+      last = i
+    totals[i] = totals.get(i, 0) + 1
+    if by == 'signal':
+      keys = (e['signo'],)
+    elif e['sender'] == e['receiver']:
+      keys = (e['sender'],)
+    else:
+      keys = (e['sender'], e['receiver'])
+    for k in keys:
+      counts = bins.get(k)
+      if counts is None:
+        counts = bins[k] = {}
+      counts[i] = counts.get(i, 0) + 1
+  return (start, last + 1, totals, bins)
+
+# Buckets are widened to a multiple of the given size if the entries span more than this many,
+# so that a small bucket on a long dump does not make rows of millions of characters
+TIMELINE_MAX_BUCKETS = 3600
+
+# Returns the bucket size to use for the entries, the given one or a multiple of it
+def timeline_bucket(entries, bucket):
+  if len(entries) == 0:
+    return bucket
+  start = min(e['seconds'] for e in entries)
+  span = max(e['seconds'] + e['microseconds']/1e6 for e in entries) - start
+  if span / bucket < TIMELINE_MAX_BUCKETS:
+    return bucket
+  return bucket * (int(span / bucket / TIMELINE_MAX_BUCKETS) + 1)
+
+SPARK_CHARS = " .:-=+*#%@"
+
+def sparkline(counts, nbuckets, peak):
+  if peak == 0:
+    return " " * nbuckets
+  top = len(SPARK_CHARS) - 1
+  return "".join(SPARK_CHARS[0 if counts.get(i, 0) == 0 else max(1, (counts.get(i, 0) * top + peak - 1) // peak)]
+                 for i in range(nbuckets))
+
+# Output one row per signal (or mailbox) with total count, peak rate and a sparkline
+# of the rate over time. The full bucket matrix can be exported as CSV.
+def print_timeline(entries, mailboxes, signals):
+  entries = filter_duplicates(entries)
+  by = args.timeline_by
+  names = signals if by == 'signal' else mailboxes
+  bucket = timeline_bucket(entries, args.timeline)
+  if bucket != args.timeline:
+    print_stderr("Using buckets of %gs instead of %gs, to have at most %u" % (bucket, args.timeline, TIMELINE_MAX_BUCKETS))
+  (start, nbuckets, totals, bins) = bucket_entries(entries, bucket, by)
+
+  if by == 'signal':
+    order = sorted(bins, key=lambda s: (1,signals[s].upper()) if s in signals else (2,s))
+    label = lambda k: "0x{0:07x}".format(k)
+  else:
+    order = sorted(bins, key=lambda b: (1,mailboxes[b].upper()) if b in mailboxes else (2,b))
+    label = lambda k: str(k)
+
+  peak = max(totals.values(), default=0)
+  length = max([len(names[k]) if k in names else 9 for k in order] + [4]) + 1
+  fmt = "{0:<10} {1:<{5}} {2:<7} {3:<9} {4}"
+
+  # The sparklines are fitted to the terminal, several buckets to a character if needed.
+  # Peak/s and the CSV keep the full resolution.
+  width = max(shutil.get_terminal_size().columns - (31 + length), 20)
+  step = -(-nbuckets // width)
+  merge = lambda counts: {i: sum(counts.get(j, 0) for j in range(i * step, (i + 1) * step)) for i in range(-(-nbuckets // step))}
+  line = lambda counts: sparkline(counts, -(-nbuckets // step), max(counts.values(), default=0))
+
+  out.line("# Timeline from %s, %u buckets of %gs, peak %u per bucket%s" %
+           (datetime.strftime(datetime.utcfromtimestamp(start), '%Y-%m-%d %H:%M:%S.%f'), nbuckets, bucket, peak,
+            ", %u buckets per character" % step if step > 1 else ""))
+  out.line(fmt.format("# " + by.capitalize(), "Name", "Count", "Peak/s", "Rate", length))
+  out.line(fmt.format("", "ALL", sum(totals.values()), "%.1f" % (peak / bucket),
+                      line(merge(totals) if step > 1 else totals), length))
+  for k in order:
+    counts = bins[k]
+    out.line(fmt.format(label(k),
+                        names[k] if k in names else "<unknown>",
+                        sum(counts.values()),
+                        "%.1f" % (max(counts.values()) / bucket),
+                        line(merge(counts) if step > 1 else counts),
+                        length))
+  out.flush()
+
+  if args.timeline_csv:
+    with open(args.timeline_csv, 'w') as fp:
+      fp.write("time, " + ", ".join(names[k] if k in names else label(k) for k in order) + "\n")
+      for i in range(nbuckets):
+        timestamp = datetime.strftime(datetime.utcfromtimestamp(start + i * bucket), '%Y-%m-%d %H:%M:%S.%f')
+        fp.write(timestamp + ", " + ", ".join(str(bins[k].get(i, 0)) for k in order) + "\n")
+    print_stderr("Timeline written to %s" % args.timeline_csv)
 
 def filter_ids(filter, idset, idmap):
   if not filter: # No filter means all ids go
@@ -490,6 +1371,88 @@ def filter_ids(filter, idset, idmap):
       selected.update( s for s in idset if matcher(s) )
   return (selected,unselected)
 
+# Decodes text and binary ship files into one list of entries, sorted on time and paired
+def load_entries(files):
+  data = EntryTable()
+  for f in files:
+    profiler.start('detect')
+    profiler.count(1)
+    text = is_text(f)
+    profiler.start('decode')
+    entries = read_text(f) if text else read_binary(f, False)
+    profiler.count(len(entries))
+    data.extend(entries)
+
+  profiler.start('sort')
+  profiler.count(len(data))
+  data = data.sorted_by_time()
+  profiler.start('pair')
+  profiler.count(len(data))
+  find_pairs(data)
+  profiler.stop()
+  return data
+
+# Returns a predicate on (sender, receiver) implementing the --mailbox-filter semantics.
+# A filter with a ':' selects signals between the mailboxes on either side of it.
+def mailbox_matcher(mailbox_filter, boxes, mailboxes):
+  if mailbox_filter and mailbox_filter.find(":") >= 0:
+    (f1,f2) = mailbox_filter.split(":")
+    (allm1,_) = filter_ids( f1, boxes, mailboxes )
+    (allm2,_) = filter_ids( f2, boxes, mailboxes )
+    return lambda s, r: ( s in allm1 and r in allm2 or s in allm2 and r in allm1 )
+  else:
+    (allm,exm) = filter_ids( mailbox_filter, boxes, mailboxes )
+    return lambda s, r: ( s in allm or r in allm ) and s not in exm and r not in exm
+
+# Parses a --from/--until time: seconds since the epoch, a date and time (UTC) such as
+# 2024-01-31 10:02:00, or HH:MM:SS for a time of day on any day.
+# Returns (seconds, True if it is a time of day)
+def parse_time(text):
+  try:
+    return (float(text), False)
+  except ValueError:
+    pass
+  for fmt in ('%H:%M:%S', '%H:%M:%S.%f'):
+    try:
+      t = datetime.strptime(text, fmt)
+      return (t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6, True)
+    except ValueError:
+      pass
+  try:
+    t = datetime.fromisoformat(text.replace('Z', ''))
+  except ValueError:
+    raise argparse.ArgumentTypeError("invalid time '%s', expected seconds, YYYY-MM-DD HH:MM:SS or HH:MM:SS" % text)
+  return ((t - datetime(1970, 1, 1)).total_seconds(), False)
+
+# True if any of the filter options are given
+def filters_given():
+  return args.signal_filter or args.mailbox_filter or args.from_time or args.until_time
+
+# Keeps entries at/after --from and before --until. An entry whose pair is filtered out is
+# left unpaired.
+def apply_time_filter(data):
+  limits = [limit + (is_start,) for (limit, is_start) in ((args.from_time, True), (args.until_time, False)) if limit]
+  def in_range(t):
+    for (value, time_of_day, is_start) in limits:
+      v = t % 86400 if time_of_day else t
+      if (v < value) if is_start else (v >= value):
+        return False
+    return True
+  return data.take([ i for (i, (s, us)) in enumerate(zip(data.seconds, data.microseconds)) if in_range(s + us/1e6) ])
+
+# Applies --from, --until, --signal-filter and --mailbox-filter to a table of entries. The
+# filters are applied to the columns, and the mailbox filter once per pair of mailboxes.
+def apply_filters(data, mailboxes, signals):
+  if args.from_time or args.until_time:
+    data = apply_time_filter(data)
+  if not (args.signal_filter or args.mailbox_filter):
+    return data
+  (alls,_) = filter_ids( args.signal_filter, get_all_signals(data), signals )
+  matches = mailbox_matcher( args.mailbox_filter, get_all_boxes(data), mailboxes )
+  edges = { edge: matches(*edge) for edge in set(zip(data.sender, data.receiver)) }
+  return data.take([ i for (i, (signo, sender, receiver)) in enumerate(zip(data.signo, data.sender, data.receiver))
+                     if signo in alls and edges[(sender, receiver)] ])
+
 def find_signal_file():
   home_file = os.path.expanduser("~/signal_list")
   if os.path.exists(home_file):
@@ -501,34 +1464,321 @@ def find_signal_file():
 
   return None
 
+# Reads mailbox and signal names from --mailboxes/--signals, or from um list and the signal_list file
+def load_names():
+  if args.mailboxes:
+    mailboxes = read_mailboxes(args.mailboxes)
+  else:
+    mailboxes = get_mailboxes()
+
+  if args.signals:
+    signals = parse_signals(args.signals)
+  else:
+    f = find_signal_file()
+    if f is not None:
+      signals = parse_signals(f)
+    else:
+      signals = {}
+  return (mailboxes, signals)
+
+# Directories that never hold ship files, skipped when searching for them
+SKIP_DIRS = {'lost+found', '__pycache__', 'node_modules'}
+# Skipped only at the root of the file system, where they are the kernel's
+ROOT_SKIP_DIRS = {'proc', 'sys', 'dev'}
+
+# Caches directory listings between searches, e.g. the repeated ones of --stream. A directory
+# is read again only when its mtime changes, which happens when entries are added, removed or
+# renamed. Listings from the last seconds are not cached, as the mtime may be too coarse to
+# show a change made right after them.
+class DirectoryCache:
+  def __init__(self):
+    self.listings = {}
+    self.cut_off = set()
+
+  # Returns the names of the subdirectories and .ship files in a directory. Hidden entries
+  # are skipped like glob does, and symbolic links to directories are not followed.
+  def listing(self, path):
+    try:
+      mtime = os.stat(path).st_mtime
+    except OSError:
+      self.listings.pop(path, None)
+      return ([], [])
+    cached = self.listings.get(path)
+    if cached and cached[0] == mtime:
+      return cached[1]
+
+    dirs = []
+    files = []
+    try:
+      with os.scandir(path) as it:
+        for entry in it:
+          if entry.name.startswith('.'):
+            continue
+          try:
+            if entry.is_dir(follow_symlinks=False):
+              if entry.name not in SKIP_DIRS:
+                dirs.append(entry.name)
+            elif entry.name.endswith('.ship'):
+              files.append(entry.name)
+          except OSError:
+            continue
+    except OSError:
+      pass
+
+    if time.time() - mtime > 2:
+      self.listings[path] = (mtime, (dirs, files))
+    return (dirs, files)
+
+  # Returns the paths, relative to top, of the .ship files at most depth directories below top,
+  # or at any depth if depth is None. Directories that are not searched because of the depth
+  # are reported once.
+  def ship_files(self, top, depth=None):
+    found = []
+    cut_off = []
+    stack = [('', 0)]
+    while stack:
+      (rel, level) = stack.pop()
+      (dirs, files) = self.listing(top + '/' + rel if rel else top)
+      if not rel and os.path.realpath(top) == '/':
+        dirs = [name for name in dirs if name not in ROOT_SKIP_DIRS]
+      found.extend(rel + name for name in files)
+      if depth is None or level < depth:
+        stack.extend((rel + name + '/', level + 1) for name in dirs)
+      else:
+        cut_off.extend(path for path in (os.path.join(top, rel + name) for name in dirs) if path not in self.cut_off)
+    if cut_off:
+      print_stderr("Not searching %u directories deeper than --search-depth %u, e.g. %s" % (len(cut_off), depth, min(cut_off)))
+      self.cut_off.update(cut_off)
+    return sorted(found)
+
+directory_cache = DirectoryCache()
+
+# True if a relative path matches the file argument pattern, like glob('**/' + pattern + '*.ship')
+def matches_file_arg(rel, pattern):
+  parts = rel.split('/')
+  n = pattern.count('/') + 1
+  return len(parts) >= n and fnmatch.fnmatchcase('/'.join(parts[-n:]), pattern + '*.ship')
+
 def get_input_files(file_args):
   files = []
 
-  oldcwd = os.getcwd()
   if "APP_TMP" in os.environ.keys():
     search_dir = os.environ["APP_TMP"]
   else:
     search_dir = "/tmp"
 
+  # The search directory is only scanned if needed, and at most once
+  found = None
+  def search():
+    nonlocal found
+    if found is None:
+      found = directory_cache.ship_files(search_dir, args.search_depth)
+    return found
+
   if len(file_args) == 0:
-    os.chdir(search_dir)
-    matches = glob.glob("**/*.ship", recursive=True)
-    files.extend([search_dir + "/" + i for i in matches])
-    os.chdir(oldcwd)
+    files.extend([search_dir + "/" + i for i in search()])
 
   else:
     for i in file_args:
       if os.path.exists(i):
         files.append(i)
       else:
-        os.chdir(search_dir)
-        matches = glob.glob("**/" + i + "*.ship", recursive=True)
-        files.extend([search_dir + "/" + i for i in matches])
-        os.chdir(oldcwd)
+        files.extend([search_dir + "/" + rel for rel in search() if matches_file_arg(rel, i)])
 
   return files
 
-def stream_files(input_files):
+# Parses a --watch rule: KIND[:TARGET]>THRESHOLD, e.g. "rej>5%", "queue:boxB>20ms", "rate>1000/s"
+# or "spike:A4CI_DATA_REQ>3x". Returns {'text', 'kind', 'target', 'threshold'}.
+WATCH_RULE_PATTERN = re.compile(r"^\s*(rej|queue|rate|spike)(?::([^>]+?))?\s*>\s*(\d+(?:\.\d*)?|\.\d+)\s*(%|ms|/s|x)?\s*$")
+WATCH_UNITS = {'rej': '%', 'queue': 'ms', 'rate': '/s', 'spike': 'x'}
+
+def parse_watch_rule(text):
+  m = WATCH_RULE_PATTERN.match(text)
+  if not m or (m.group(4) and m.group(4) != WATCH_UNITS[m.group(1)]):
+    raise argparse.ArgumentTypeError("invalid rule '%s', expected e.g. rej>5%%, queue:MAILBOX>20ms, rate:SIGNAL>1000/s or spike>3x" % text)
+  return {'text': text.strip(), 'kind': m.group(1), 'target': m.group(2), 'threshold': float(m.group(3))}
+
+# Sums values per key over a sliding window of time, in a ring of buckets indexed by time
+# divided by the bucket width. Adding a value and moving the window are O(1) per value, and
+# the window sums are kept in totals.
+class RollingCounter:
+  def __init__(self, nbuckets):
+    self.buckets = [{} for i in range(nbuckets)]
+    self.totals = {}
+    self.newest = None
+
+  def add(self, index, key, value=1):
+    if self.newest is None or index > self.newest:
+      self.advance(index)
+    elif index <= self.newest - len(self.buckets):
+      return # older than the window
+    bucket = self.buckets[index % len(self.buckets)]
+    bucket[key] = bucket.get(key, 0) + value
+    self.totals[key] = self.totals.get(key, 0) + value
+
+  # Moves the window to end with bucket index, dropping the buckets that leave it
+  def advance(self, index):
+    if self.newest is not None:
+      if index <= self.newest:
+        return
+      for i in range(max(self.newest + 1, index - len(self.buckets) + 1), index + 1):
+        bucket = self.buckets[i % len(self.buckets)]
+        for (key, value) in bucket.items():
+          total = self.totals[key] - value
+          if total:
+            self.totals[key] = total
+          else:
+            del self.totals[key]
+        bucket.clear()
+    self.newest = index
+
+# Keeps rolling counters of the streamed entries and checks the --watch rules each time the
+# window moves by a bucket. An alert is written when a rule starts to match a procedure,
+# mailbox or signal, and a clear when it stops.
+WATCH_BUCKETS = 10
+# TX and RX entries are paired on the first match, as in find_pairs, but only within this many
+# seconds. The files are read one at a time, so an RX can be read before its TX.
+WATCH_PAIR_TIMEOUT = 10.0
+# Weight of each check in the baseline rate of spike rules. With ten checks per window, the
+# baseline follows the rate over about five windows.
+WATCH_BASELINE_WEIGHT = 0.02
+
+class Watcher:
+  def __init__(self, rules, window, min_count, mailboxes, signals, output):
+    self.rules = rules
+    self.window = window
+    self.min_count = min_count
+    self.mailboxes = mailboxes
+    self.signals = signals
+    self.output = output
+    self.bucket = None
+    self.width = window / WATCH_BUCKETS
+    self.sent = RollingCounter(WATCH_BUCKETS)      # signo -> TX count
+    self.replies = RollingCounter(WATCH_BUCKETS)   # procedure -> CFM and REJ count
+    self.rejects = RollingCounter(WATCH_BUCKETS)   # procedure -> REJ count
+    self.queued = RollingCounter(WATCH_BUCKETS)    # receiver -> paired RX count
+    self.queue_us = RollingCounter(WATCH_BUCKETS)  # receiver -> sum of queue times in us
+    self.pending = {}    # (signo, sender, receiver, procId, connId) -> deque of unpaired TX times in us
+    self.received = {}   # the same key -> deque of unpaired (RX time in us, bucket index)
+    self.procedures = {} # signo -> (procedure, role) or None
+    self.baselines = {}  # (rule index, signo) -> [baseline rate, checks since it started]
+    self.active = {}     # (rule index, key) -> name of the key
+    self.checks = 0
+    self.last_sweep = 0
+
+  def procedure(self, signo):
+    if signo not in self.procedures:
+      m = TRANSACTION_PATTERN.match(self.signals.get(signo, ''))
+      self.procedures[signo] = (m.group(1) + m.group(3), m.group(2).upper()) if m else None
+    return self.procedures[signo]
+
+  def add(self, entry):
+    us = entry['seconds'] * 1000000 + entry['microseconds']
+    index = int(us / 1e6 / self.width)
+    if self.bucket is None:
+      self.bucket = index
+    elif index > self.bucket:
+      self.check(us)
+      self.bucket = index
+
+    key = (entry['signo'], entry['sender'], entry['receiver'], entry['procId'], entry['connId'])
+    if entry['type'] == ITC_SEND:
+      self.sent.add(index, entry['signo'])
+      received = self.received.get(key)
+      while received and received[0][0] < us:
+        received.popleft()
+      if received:
+        (rx_us, rx_index) = received.popleft()
+        self.add_queue_time(rx_index, entry['receiver'], rx_us - us)
+      else:
+        self.pending.setdefault(key, deque()).append(us)
+      procedure = self.procedure(entry['signo'])
+      if procedure and procedure[1] in TRANSACTION_REPLIES and procedure[1] != 'RSP':
+        self.replies.add(index, procedure[0])
+        if procedure[1] == 'REJ':
+          self.rejects.add(index, procedure[0])
+    elif entry['type'] == ITC_RECV:
+      sent = self.pending.get(key)
+      while sent and sent[0] < us - WATCH_PAIR_TIMEOUT * 1e6:
+        sent.popleft()
+      if sent and sent[0] <= us:
+        self.add_queue_time(index, entry['receiver'], us - sent.popleft())
+      else:
+        self.received.setdefault(key, deque()).append((us, index))
+
+  def add_queue_time(self, index, receiver, us):
+    self.queued.add(index, receiver)
+    self.queue_us.add(index, receiver, us)
+
+  def matches(self, target, number, names):
+    return target is None or target == names.get(number) or target == str(number) or target.lower() == hex(number)
+
+  # Returns {key: (name, description)} for the keys that the i:th rule matches in the window
+  def evaluate(self, i, rule):
+    (kind, target, threshold) = (rule['kind'], rule['target'], rule['threshold'])
+    found = {}
+    if kind == 'rej':
+      for (procedure, replies) in self.replies.totals.items():
+        rejects = self.rejects.totals.get(procedure, 0)
+        if replies >= self.min_count and (target is None or target.upper() == procedure.upper()) \
+           and 100.0 * rejects / replies > threshold:
+          found[procedure] = (procedure, "%s rejected %.1f%% (%u of %u)" % (procedure, 100.0 * rejects / replies, rejects, replies))
+    elif kind == 'queue':
+      for (receiver, count) in self.queued.totals.items():
+        average = self.queue_us.totals.get(receiver, 0) / count / 1000
+        if count >= self.min_count and self.matches(target, receiver, self.mailboxes) and average > threshold:
+          name = self.mailboxes.get(receiver, str(receiver))
+          found[receiver] = (name, "%s average queue time %.3f ms (%u signals)" % (name, average, count))
+    else:
+      for (signo, count) in self.sent.totals.items():
+        if not self.matches(target, signo, self.signals):
+          continue
+        rate = count / self.window
+        name = self.signals.get(signo, "0x%x" % signo)
+        if kind == 'rate':
+          if rate > threshold:
+            found[signo] = (name, "%s %.1f/s" % (name, rate))
+          continue
+        # The baseline starts when the first window is full, and is used after another window
+        if self.checks < WATCH_BUCKETS:
+          continue
+        baseline = self.baselines.setdefault((i, signo), [rate, 0])
+        if baseline[1] >= WATCH_BUCKETS and count >= self.min_count and rate > threshold * baseline[0]:
+          found[signo] = (name, "%s %.1f/s, %.1fx the usual %.1f/s" % (name, rate, rate / baseline[0], baseline[0]))
+        baseline[0] += WATCH_BASELINE_WEIGHT * (rate - baseline[0])
+        baseline[1] += 1
+    return found
+
+  # Checks the rules on the window that ends with the current bucket
+  def check(self, now_us):
+    for counter in (self.sent, self.replies, self.rejects, self.queued, self.queue_us):
+      counter.advance(self.bucket)
+    timestamp = datetime.strftime(datetime.utcfromtimestamp((self.bucket + 1) * self.width), '%Y-%m-%d %H:%M:%S')
+    for (i, rule) in enumerate(self.rules):
+      found = self.evaluate(i, rule)
+      for (key, (name, text)) in found.items():
+        if (i, key) not in self.active:
+          self.alert("%s ALERT %s: %s in the last %gs" % (timestamp, rule['text'], text, self.window))
+          self.active[(i, key)] = name
+      for key in [k for k in self.active if k[0] == i and k[1] not in found]:
+        self.alert("%s CLEAR %s: %s" % (timestamp, rule['text'], self.active.pop(key)))
+
+    self.checks += 1
+
+    # Entries that were not paired within the timeout are forgotten
+    if now_us - self.last_sweep > WATCH_PAIR_TIMEOUT * 1e6:
+      limit = now_us - WATCH_PAIR_TIMEOUT * 1e6
+      for key in [k for (k, sent) in self.pending.items() if not sent or sent[-1] < limit]:
+        del self.pending[key]
+      for key in [k for (k, received) in self.received.items() if not received or received[-1][0] < limit]:
+        del self.received[key]
+      self.last_sweep = now_us
+
+  def alert(self, text):
+    print(text, file=self.output, flush=True)
+
+# Prints the entries that are added to the files, and/or passes them to a Watcher
+def stream_files(input_files, watcher=None):
   # lowest prio, will consume one core whhile running
   os.nice(20)
 
@@ -557,18 +1807,14 @@ def stream_files(input_files):
       i = 0
       truncated = True
       overlaps = False
+      added = []
       while i < len(entries):
         entry = entries[i]
         if entry['seconds'] != 0 and (i >= len(previous) or previous[i] != entry):
-          if args.dont_convert_hex_data:
-            print("%u.%06u %u %u %u %u 0x%x %s%s" % (entry['seconds'], entry['microseconds'], entry['type'], \
-                                                     entry['source'], entry['sender'], entry['receiver'], \
-                                                     entry['signo'], "".join("\\x%02x" % i for i in entry['procId']), \
-                                                     "".join("\\x%02x" % i for i in entry['connId'])))
-          else:
-            print("%u.%06u %u %u %u %u 0x%x %u %u" % (entry['seconds'], entry['microseconds'], entry['type'], \
-                                                      entry['source'], entry['sender'], entry['receiver'], \
-                                                      entry['signo'], convert_hex_data(entry['procId']), convert_hex_data(entry['connId'])))
+          if watcher:
+            watcher.add(entry)
+          if args.stream:
+            added.append(entry)
 
         elif entry['seconds'] == 0:
           truncated = False
@@ -583,7 +1829,471 @@ def stream_files(input_files):
         print_stderr("Initial signals may have been lost from input %s" % f)
 
       previous_data[f] = entries
+      out.lines(format_text_lines(added))
+
+    # Written once per pass, so that a reader such as aggregate_ship.py gets the entries promptly
+    out.flush()
+
+
+SQLITE_SCHEMA = """
+DROP VIEW IF EXISTS events;
+DROP TABLE IF EXISTS entries;
+DROP TABLE IF EXISTS pairs;
+DROP TABLE IF EXISTS mailboxes;
+DROP TABLE IF EXISTS signals;
+CREATE TABLE entries (id INTEGER PRIMARY KEY, time REAL, seconds INTEGER, microseconds INTEGER,
+                      type INTEGER, source INTEGER, sender INTEGER, receiver INTEGER, signo INTEGER,
+                      procId, connId);
+CREATE TABLE pairs (tx INTEGER PRIMARY KEY, rx INTEGER, queue_time REAL);
+CREATE TABLE mailboxes (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE signals (signo INTEGER PRIMARY KEY, name TEXT);
+CREATE VIEW events AS
+  SELECT e.*, m1.name AS sender_name, m2.name AS receiver_name, s.name AS signal_name, p.queue_time
+  FROM entries e
+  LEFT JOIN mailboxes m1 ON m1.id = e.sender
+  LEFT JOIN mailboxes m2 ON m2.id = e.receiver
+  LEFT JOIN signals s ON s.signo = e.signo
+  LEFT JOIN pairs p ON p.tx = e.id
+  WHERE e.type = 0 OR e.id NOT IN (SELECT rx FROM pairs);
+"""
+
+SQLITE_INDEXES = """
+CREATE INDEX entries_time ON entries (time);
+CREATE INDEX entries_signo ON entries (signo, time);
+CREATE INDEX entries_sender ON entries (sender, time);
+CREATE INDEX entries_receiver ON entries (receiver, time);
+CREATE INDEX pairs_rx ON pairs (rx);
+"""
+
+SQLITE_BATCH = 50000
+
+# Yields (seconds, microseconds, type, source, sender, receiver, signo, procId, connId) of the entries
+# as they are stored in the database. procId and connId of a table are converted once per distinct value.
+def sqlite_rows(entries):
+  if args.dont_convert_hex_data:
+    hex_data = lambda d: d
+  else:
+    hex_data = convert_hex_data
+
+  if isinstance(entries, EntryTable):
+    ids = [hex_data(d) for d in entries.ids]
+    return ((seconds, microseconds, kind, source, sender, receiver, signo, ids[procId], ids[connId])
+            for (seconds, microseconds, kind, source, sender, receiver, signo, procId, connId)
+            in zip(entries.seconds, entries.microseconds, entries.type, entries.source, entries.sender,
+                   entries.receiver, entries.signo, entries.procId, entries.connId))
+  return ((e['seconds'], e['microseconds'], e['type'], e['source'], e['sender'], e['receiver'], e['signo'],
+           hex_data(e['procId']), hex_data(e['connId'])) for e in entries)
+
+# Yields (TX row, RX row, queue time) of the pairs where both entries are in entries
+def sqlite_pairs(entries):
+  if isinstance(entries, EntryTable):
+    (seconds, microseconds) = (entries.seconds, entries.microseconds)
+    return ((i, j, seconds[j] + microseconds[j]/1e6 - (seconds[i] + microseconds[i]/1e6))
+            for (i, (kind, j)) in enumerate(zip(entries.type, entries.pair)) if kind == ITC_SEND and j >= 0)
+  rows = {entry_key(e): i for (i, e) in enumerate(entries)}
+  return ((rows[entry_key(e)], rows[entry_key(e['pair'])],
+           e['pair']['seconds'] + e['pair']['microseconds']/1e6 - (e['seconds'] + e['microseconds']/1e6))
+          for e in entries if e['type'] == ITC_SEND and 'pair' in e and entry_key(e['pair']) in rows)
+
+# Bulk loads entries, pairs, mailbox names and signal names into a new set of tables in
+# an SQLite database. The events view has one row per signal (as the CSV output) with names
+# and queue time joined in. Indexes are created after the load, which is faster than
+# maintaining them per row.
+def write_sqlite(path, entries, mailboxes, signals):
+  db = sqlite3.connect(path)
+  db.executescript(SQLITE_SCHEMA)
+
+  with db:
+    for batch in batches(((i, row[0] + row[1]/1e6) + row for (i, row) in enumerate(sqlite_rows(entries))), SQLITE_BATCH):
+      db.executemany("INSERT INTO entries VALUES (?,?,?,?,?,?,?,?,?,?,?)", batch)
+
+    for batch in batches(sqlite_pairs(entries), SQLITE_BATCH):
+      db.executemany("INSERT INTO pairs VALUES (?,?,?)", batch)
+
+    db.executemany("INSERT INTO mailboxes VALUES (?,?)", mailboxes.items())
+    db.executemany("INSERT INTO signals VALUES (?,?)", signals.items())
+
+  with db:
+    db.executescript(SQLITE_INDEXES)
+  db.close()
+  print_stderr("Wrote %u signals to %s" % (len(entries), path))
+
+# Entries this close in time to the appended ones are paired again, so that a signal that was
+# sent before one collection and received after it is paired
+SQLITE_PAIR_MARGIN = 60.0
+
+# Adds the entries that are not already in a database written by --sqlite, e.g. when the same
+# rings are collected repeatedly. An entry is already there if one has the same time, type,
+# mailboxes, signal and procId/connId. The rows are added to the indexed tables instead of
+# rebuilding them, and pairs are only found again around the new entries.
+def append_sqlite(path, entries, mailboxes, signals):
+  db = sqlite3.connect(path)
+  if db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries'").fetchone() is None:
+    db.close()
+    write_sqlite(path, entries, mailboxes, signals)
+    return
+
+  # Entries with the ids stored the other way would never match
+  stored = db.execute("SELECT typeof(procId) FROM entries LIMIT 1").fetchone()
+  if stored is not None and (stored[0] == 'blob') != bool(args.dont_convert_hex_data):
+    print_stderr("%s was written %s --dont_convert_hex_data, append with the same" % (path, "with" if stored[0] == 'blob' else "without"))
+    exit(1)
 
+  new = []
+  if len(entries) > 0:
+    rows = list(sqlite_rows(entries))
+    times = [row[0] + row[1]/1e6 for row in rows]
+    # Each row in the archive accounts for one identical entry in the new data, so identical
+    # entries are kept as often as --sqlite keeps them
+    seen = {}
+    for key in db.execute("SELECT seconds, microseconds, type, sender, receiver, signo, procId, connId FROM entries "
+                          "WHERE time BETWEEN ? AND ?", (min(times), max(times))):
+      seen[key] = seen.get(key, 0) + 1
+    next_id = db.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM entries").fetchone()[0]
+    for (t, row) in zip(times, rows):
+      key = row[:3] + row[4:]
+      if seen.get(key):
+        seen[key] -= 1
+      else:
+        new.append((next_id + len(new), t) + row)
+
+  with db:
+    for batch in batches(new, SQLITE_BATCH):
+      db.executemany("INSERT INTO entries VALUES (?,?,?,?,?,?,?,?,?,?,?)", batch)
+    if new:
+      pair_sqlite_range(db, min(r[1] for r in new) - SQLITE_PAIR_MARGIN, max(r[1] for r in new) + SQLITE_PAIR_MARGIN)
+    db.executemany("INSERT OR REPLACE INTO mailboxes VALUES (?,?)", mailboxes.items())
+    db.executemany("INSERT OR REPLACE INTO signals VALUES (?,?)", signals.items())
+  db.close()
+  print_stderr("Added %u new signals to %s, %u were already there" % (len(new), path, len(entries) - len(new)))
+
+# Finds the pairs of the entries from start to end again. Pairs with one entry outside the
+# range are kept, and their entries are not paired again.
+def pair_sqlite_range(db, start, end):
+  inside = []
+  kept = set()
+  for (tx, rx, tx_time, rx_time) in itertools.chain(
+      db.execute("SELECT p.tx, p.rx, a.time, b.time FROM entries a JOIN pairs p ON p.tx = a.id JOIN entries b ON b.id = p.rx "
+                 "WHERE a.time BETWEEN ?1 AND ?2", (start, end)),
+      db.execute("SELECT p.tx, p.rx, a.time, b.time FROM entries b JOIN pairs p ON p.rx = b.id JOIN entries a ON a.id = p.tx "
+                 "WHERE b.time BETWEEN ?1 AND ?2 AND NOT a.time BETWEEN ?1 AND ?2", (start, end))):
+    if start <= tx_time <= end and start <= rx_time <= end:
+      inside.append((tx,))
+    else:
+      kept.update((tx, rx))
+  db.executemany("DELETE FROM pairs WHERE tx = ?", inside)
+
+  table = EntryTable()
+  ids = []
+  for row in db.execute("SELECT id, type, source, sender, receiver, seconds, microseconds, signo, procId, connId FROM entries "
+                        "WHERE time BETWEEN ? AND ? ORDER BY seconds, microseconds, id", (start, end)):
+    if row[0] not in kept:
+      ids.append(row[0])
+      table.append(*row[1:])
+  find_pairs(table)
+
+  db.executemany("INSERT INTO pairs VALUES (?,?,?)",
+                 ((ids[i], ids[j], table.seconds[j] + table.microseconds[j]/1e6 - (table.seconds[i] + table.microseconds[i]/1e6))
+                  for (i, j) in enumerate(table.pair) if j >= 0 and table.type[i] == ITC_SEND))
+
+# Runs an SQL query against a database written by --sqlite and prints the result as CSV
+def print_query(path, sql):
+  db = sqlite3.connect(path)
+  try:
+    cursor = db.execute(sql)
+  except sqlite3.Error as e:
+    print_stderr("Query failed: %s" % e)
+    exit(1)
+
+  if cursor.description is not None:
+    out.line(", ".join(c[0] for c in cursor.description))
+  for row in cursor:
+    out.line(", ".join(" ".join("%02x" % i for i in v) if isinstance(v, bytes) else str(v) for v in row))
+  db.close()
+  out.flush()
+
+# Number of aggregates and of selected row lists that a --serve instance keeps
+AGGREGATE_CACHE = 64
+SELECTION_CACHE = 8
+
+# In-memory table of decoded entries for --serve, with a sorted time column for binary search
+# and an index of row numbers per signal.
+class ShipStore:
+  def __init__(self, entries, mailboxes, signals, files):
+    self.mailboxes = mailboxes
+    self.signals = signals
+    self.files = files
+    self.table = entries
+    self.time = entries.times()
+    self.by_signo = {}
+    for (i, signo) in enumerate(entries.signo):
+      rows_of_signo = self.by_signo.get(signo)
+      if rows_of_signo is None:
+        rows_of_signo = self.by_signo[signo] = array('L')
+      rows_of_signo.append(i)
+    self.boxes = set(entries.sender) | set(entries.receiver)
+    self.cache = {}
+    self.selections = {}
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.time)
+
+  # Returns the rows between start and end (microseconds, inclusive) that pass the filters.
+  # The signal filter is resolved through the signal index, so only matching rows are visited,
+  # and the mailbox filter once per pair of mailboxes.
+  def select(self, signal_filter, mailbox_filter, start, end):
+    lo = bisect.bisect_left(self.time, start) if start is not None else 0
+    hi = bisect.bisect_right(self.time, end) if end is not None else len(self.time)
+
+    if signal_filter:
+      (alls,_) = filter_ids( signal_filter, set(self.by_signo), self.signals )
+      candidates = []
+      for signo in alls:
+        rows = self.by_signo[signo]
+        candidates.extend(rows[bisect.bisect_left(rows, lo):bisect.bisect_left(rows, hi)])
+      candidates.sort()
+    else:
+      candidates = range(lo, hi)
+
+    if not mailbox_filter:
+      return candidates
+    matches = mailbox_matcher( mailbox_filter, self.boxes, self.mailboxes )
+    edges = {}
+    selected = []
+    for i in candidates:
+      edge = (self.table.sender[i], self.table.receiver[i])
+      match = edges.get(edge)
+      if match is None:
+        match = edges[edge] = matches(*edge)
+      if match:
+        selected.append(i)
+    return selected
+
+  # Returns the value cached under key, or makes it with make() and caches it. Queries are
+  # answered in threads, so the caches are only changed under the lock.
+  def cached(self, cache, key, make, size):
+    with self.lock:
+      if key in cache:
+        return cache[key]
+    value = make()
+    with self.lock:
+      if key not in cache:
+        while len(cache) >= size:
+          cache.pop(next(iter(cache)))
+        cache[key] = value
+      return cache[key]
+
+  # Returns the rows of select(), cached per selection, so that fetching the pages of a large
+  # selection does not select it again for every page. Lists of rows are kept as arrays.
+  def selection(self, *selection):
+    def make():
+      rows = self.select(*selection)
+      return rows if isinstance(rows, range) else array('L', rows)
+    return self.cached(self.selections, selection, make, SELECTION_CACHE)
+
+  # Returns row i as a JSON friendly entry, with its row number
+  def row(self, i, with_pair=True):
+    table = self.table
+    entry = {'row': i, 'type': table.type[i], 'source': table.source[i], 'sender': table.sender[i],
+             'receiver': table.receiver[i], 'seconds': table.seconds[i], 'microseconds': table.microseconds[i],
+             'signo': table.signo[i], 'procId': json_id(table.ids[table.procId[i]]),
+             'connId': json_id(table.ids[table.connId[i]])}
+    if with_pair and table.pair[i] >= 0:
+      entry['pair'] = self.row(table.pair[i], False)
+    return entry
+
+  # Returns the rows as a table. Pairs that are not among the rows are left out.
+  def entries(self, rows):
+    return self.table.take(rows)
+
+  # Returns a page of the rows as the columns of a table, see encode_column. Pairs are positions
+  # in rows, so that they hold across pages, or -1 if the paired entry is not among the rows.
+  def columns(self, rows, offset, limit):
+    page = self.table.take(rows[offset:offset + limit], True)
+    if isinstance(rows, range):
+      position = lambda p: p - rows.start if p in rows else -1
+    else:
+      def position(p):
+        i = bisect.bisect_left(rows, p)
+        return i if p >= 0 and i < len(rows) and rows[i] == p else -1
+    page.pair = array('i', map(position, page.pair))
+    return {'total': len(rows), 'offset': offset, 'ids': [json_id(value) for value in page.ids],
+            'columns': {name: encode_column(getattr(page, name)) for (name, typecode) in EntryTable.TYPECODES}}
+
+# procId and connId in JSON: hex strings when they are bytes
+def json_id(value):
+  return value.hex() if isinstance(value, bytes) else value
+
+def decode_json_id(value):
+  return bytes.fromhex(value) if isinstance(value, str) else value
+
+# Columns are sent as base64 of the little-endian array
+def encode_column(column):
+  if sys.byteorder == 'big':
+    column = array(column.typecode, column)
+    column.byteswap()
+  return base64.b64encode(column.tobytes()).decode()
+
+def decode_column(typecode, text):
+  column = array(typecode)
+  column.frombytes(base64.b64decode(text))
+  if sys.byteorder == 'big':
+    column.byteswap()
+  return column
+
+# Answers the --serve queries. All take the optional parameters signal-filter, mailbox-filter,
+# and from/until (seconds since the epoch):
+#   /info               number of entries, time span and input files
+#   /names              mailbox and signal names
+#   /rows               a page of entries, with offset (default 0) and limit (default 1000). The
+#                       row numbers of the entries and their pairs identify them across pages
+#   /columns            a page of entries as the columns of a table, with offset and limit, as
+#                       used by --server
+#   /summary            counts and first/last time per signal and mailbox, as --summary
+#   /latency            queue time percentiles in seconds per signal
+class ShipRequestHandler(http.server.BaseHTTPRequestHandler):
+  store = None
+
+  def do_GET(self):
+    url = urllib.parse.urlsplit(self.path)
+    query = {k: v[-1] for (k, v) in urllib.parse.parse_qs(url.query).items()}
+    try:
+      result = self.answer(url.path, query)
+    except SystemExit:
+      return self.reply(400, {'error': 'invalid filter'})
+    except (KeyError, ValueError) as e:
+      return self.reply(400, {'error': str(e)})
+    if result is None:
+      return self.reply(404, {'error': 'unknown query %s' % url.path})
+    self.reply(200, result)
+
+  def answer(self, path, query):
+    store = self.store
+    if path == '/info':
+      return {'count': len(store), 'files': store.files,
+              'first': store.time[0] / 1e6 if len(store) else None,
+              'last': store.time[-1] / 1e6 if len(store) else None}
+    if path == '/names':
+      return {'mailboxes': store.mailboxes, 'signals': store.signals}
+
+    to_us = lambda t: None if t is None else int(float(t) * 1000000)
+    selection = (query.get('signal-filter'), query.get('mailbox-filter'),
+                 to_us(query.get('from')), to_us(query.get('until')))
+
+    if path == '/rows':
+      rows = store.selection(*selection)
+      offset = int(query.get('offset', 0))
+      limit = int(query.get('limit', 1000))
+      return {'total': len(rows), 'offset': offset,
+              'rows': [store.row(i) for i in rows[offset:offset + limit]]}
+
+    if path == '/columns':
+      return store.columns(store.selection(*selection), int(query.get('offset', 0)), int(query.get('limit', SERVER_PAGE)))
+
+    if path not in ('/summary', '/latency'):
+      return None
+
+    # Aggregates are cached per query, since they visit every selected row
+    return store.cached(store.cache, (path,) + selection, lambda: self.aggregate(path, selection), AGGREGATE_CACHE)
+
+  def aggregate(self, path, selection):
+    store = self.store
+    stats = aggregate(filter_duplicates(store.entries(store.selection(*selection))))
+    if path == '/summary':
+      return {'count': stats['count'], 'first': stats['first'], 'last': stats['last'],
+              'signals': {s: {k: v for (k, v) in st.items() if k != 'queue'}
+                          for (s, st) in stats['signals'].items()},
+              'mailboxes': stats['mailboxes']}
+    latency = {}
+    for (signo, st) in stats['signals'].items():
+      queue = sorted(st['queue'])
+      latency[signo] = {'count': len(queue), 'p50': percentile(queue, 50), 'p90': percentile(queue, 90),
+                        'p99': percentile(queue, 99), 'max': queue[-1] if queue else None}
+    return latency
+
+  def reply(self, status, result):
+    body = json.dumps(result).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+# Parses [HOST:]PORT, where HOST defaults to localhost
+def parse_address(text):
+  (host, _, port) = text.rpartition(':')
+  return (host or '127.0.0.1', int(port))
+
+# Decodes the input once and answers queries on it over HTTP until interrupted
+def serve(files, address):
+  (mailboxes, signals) = load_names()
+  data = load_entries(files)
+  ShipRequestHandler.store = ShipStore(data, mailboxes, signals, files)
+  del data
+
+  server = http.server.ThreadingHTTPServer(parse_address(address), ShipRequestHandler)
+  print_stderr("Serving %u signals from %u file(s) on http://%s:%u" %
+               ((len(ShipRequestHandler.store), len(files)) + server.server_address[:2]))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+def server_query(address, path, query):
+  url = "http://%s:%u%s?%s" % (parse_address(address) + (path, urllib.parse.urlencode(query)))
+  try:
+    with urllib.request.urlopen(url) as response:
+      return json.load(response)
+  except urllib.error.HTTPError as e:
+    print_stderr("Query %s failed: %s" % (path, json.load(e).get('error')))
+    exit(1)
+  except urllib.error.URLError as e:
+    print_stderr("Could not reach ship server at %s: %s" % (address, e.reason))
+    exit(1)
+
+# Rows per /columns page
+SERVER_PAGE = 1000000
+
+# Fetches the entries selected by --signal-filter and --mailbox-filter from a --serve instance
+# into a table, column by column. An entry whose pair was not selected is left unpaired. The
+# server only takes times as seconds since the epoch, so --from and --until only narrow the
+# fetch, and are applied with apply_time_filter after it.
+def load_server_entries(address):
+  query = {k: v for (k, v) in (('signal-filter', args.signal_filter), ('mailbox-filter', args.mailbox_filter)) if v}
+  for (k, limit) in (('from', args.from_time), ('until', args.until_time)):
+    if limit and not limit[1]:
+      query[k] = repr(limit[0])
+  data = EntryTable()
+  while True:
+    query['offset'] = len(data)
+    query['limit'] = SERVER_PAGE
+    page = server_query(address, '/columns', query)
+    part = EntryTable()
+    for (name, typecode) in EntryTable.TYPECODES:
+      setattr(part, name, decode_column(typecode, page['columns'][name]))
+    part.ids = [decode_json_id(value) for value in page['ids']]
+    part.id_index = {value: i for (i, value) in enumerate(part.ids)}
+    start = len(data)
+    data.extend(part)
+    # Pairs are positions in the whole selection, not in the page
+    data.pair[start:] = part.pair
+    if len(part) == 0 or len(data) >= page['total']:
+      return data
+
+# Reads mailbox and signal names from a --serve instance, unless given on the command line
+def load_server_names(address):
+  names = server_query(address, '/names', {})
+  mailboxes = {int(k): v for (k, v) in names['mailboxes'].items()}
+  signals = {int(k): v for (k, v) in names['signals'].items()}
+  if args.mailboxes:
+    mailboxes = read_mailboxes(args.mailboxes)
+  if args.signals:
+    signals = parse_signals(args.signals)
+  return (mailboxes, signals)
 
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description='Interprets and transforms SHIP files to more human readable formats.')
@@ -592,6 +2302,8 @@ if __name__ == "__main__":
   parser.add_argument('--signals', help='a file which contains a list of signal- name/number associations. Format: \'NAME NUMBER_HEX NUMBER_DEC\'')
   parser.add_argument('--signal-filter', metavar='FILTER', help='comma delimited list of signals to include (or exclude if prepended with -)')
   parser.add_argument('--mailbox-filter', metavar='FILTER', help='comma delimited list of mailboxes to include (or exclude if prepended with -)')
+  parser.add_argument('--from', dest='from_time', metavar='TIME', type=parse_time, help='only include signals at/after TIME: seconds since the epoch, YYYY-MM-DD HH:MM:SS (UTC) or HH:MM:SS on any day')
+  parser.add_argument('--until', dest='until_time', metavar='TIME', type=parse_time, help='only include signals before TIME, in the same formats as --from')
   # used for testing, to compare with outputted file
   parser.add_argument('--dont_convert_hex_data', action='store_true', help='if hex data should not be converted to procId and connId')
   parser.add_argument('--little_endian', action='store_true', help='if little endian is used for hex data, deafult is big endian')
@@ -601,71 +2313,137 @@ if __name__ == "__main__":
   group.add_argument('--uml', action='store_true', help='print plantuml output')
   group.add_argument('--json', action='store_true', help='print parsed shipdata as JSON')
   group.add_argument('--summary', action='store_true', help='print counts of signals and mailboxes')
-  group.add_argument('--clear', action='store_true', help='clears ship logs. Only possible in a production environment')
+  group.add_argument('--clear', action='store_true', help='clears ship logs, or with --until only the signals before that time (a date and time or seconds since the epoch). Only possible in a production environment')
+  group.add_argument('--timeline', metavar='BUCKET', type=parse_bucket, help='print signal rates over time in buckets of BUCKET seconds (e.g. 1, 0.5s, 100ms, 2m)')
+  group.add_argument('--compare', nargs=2, metavar=('A', 'B'), help='compare signal and edge rates and queue times between two dumps (files or directories)')
+  group.add_argument('--transactions', action='store_true', help='match *_REQ with *_CFM/*_REJ (and *_IND with *_RSP) and print latency, timeouts and reject rate per procedure')
+  group.add_argument('--sqlite', metavar='DB', help='write entries, pairs, mailbox and signal names to tables in the SQLite database DB. See also --query')
+  parser.add_argument('--append', action='store_true', help='with --sqlite, only add the signals that are not already in DB (from an earlier collection of the same rings), and keep the rest of DB')
+  parser.add_argument('--query', metavar='SQL', help='run SQL against the --sqlite database and print the result as CSV. Input is only loaded if files are given or DB does not exist')
+  group.add_argument('--extract', metavar='FILE', help='write the filtered signals as a compact ship file to FILE (- for stdout), e.g. to filter on the node before transfer')
+  group.add_argument('--serve', metavar='[HOST:]PORT', help='decode the input once and answer queries over HTTP on HOST (default localhost) and PORT')
+  parser.add_argument('--server', metavar='[HOST:]PORT', help='read entries and names from a running --serve instance instead of decoding files')
+  parser.add_argument('--transaction-timeout', metavar='SECONDS', type=float, default=5.0, help='time after which an unanswered --transactions request counts as timed out (default 5)')
+  parser.add_argument('--compare-top', metavar='N', type=int, default=20, help='number of largest changes to show per --compare table (default 20)')
+  parser.add_argument('--timeline-by', choices=['signal', 'mailbox'], default='signal', help='group --timeline rows on signal (default) or mailbox')
+  parser.add_argument('--timeline-csv', metavar='FILE', help='also write the full --timeline bucket counts as CSV to FILE')
+  parser.add_argument('--watch', metavar='RULE', type=parse_watch_rule, action='append', help='follow the files like --stream (which also prints the entries) and alert when RULE matches in the window: rej[:PROCEDURE]>PERCENT%%, queue[:MAILBOX]>MSms (average), rate[:SIGNAL]>N/s or spike[:SIGNAL]>FACTORx (rate compared with the recent baseline). Can be repeated')
+  parser.add_argument('--watch-window', metavar='SECONDS', type=parse_bucket, default=10.0, help='sliding window of the --watch rules, e.g. 10 or 500ms (default 10s)')
+  parser.add_argument('--watch-min', metavar='N', type=int, default=10, help='signals needed in the window before rej, queue and spike rules can alert (default 10)')
+  parser.add_argument('--watch-output', metavar='FILE', help='append --watch alerts to FILE instead of stderr')
+  parser.add_argument('--search-depth', metavar='N', type=int, help='number of directory levels below $APP_TMP or /tmp to search for ship files (default no limit)')
+  parser.add_argument('--profile', metavar='FILE', nargs='?', const='-', help='print wall and CPU time, entry counts and max RSS per stage to stderr, or as JSON to FILE')
+  parser.add_argument('--profile-hook', choices=['cprofile', 'tracemalloc'], help='with --profile, also print the functions with the most time (cprofile) or the largest allocations (tracemalloc)')
   args = parser.parse_args()
 
+  # --watch follows the files like --stream, and the other modes would be silently ignored
+  if args.watch:
+    modes = ['--' + name for name in ('text', 'uml', 'json', 'summary', 'clear', 'timeline', 'compare', 'transactions',
+                                      'sqlite', 'extract', 'serve', 'server') if getattr(args, name)]
+    if modes:
+      parser.error("--watch can only be combined with --stream, not with %s" % ", ".join(modes))
+  # --server replaces the input files, which these modes work on directly
+  if args.server:
+    modes = ['--' + name for name in ('clear', 'serve', 'stream', 'watch', 'compare') if getattr(args, name)]
+    if modes:
+      parser.error("--server can not be combined with %s" % ", ".join(modes))
+  if args.append and not args.sqlite:
+    parser.error("--append needs a database, see --sqlite")
+
+  if args.profile or args.profile_hook:
+    profiler.enable(args.profile_hook)
+    # Most modes end with exit(), so the breakdown is printed at exit
+    atexit.register(profiler.report, args.profile)
+
   # stream detects files as they are created
-  if args.stream:
-    stream_files(args.input_file)
+  if args.stream or args.watch:
+    watcher = None
+    if args.watch:
+      (mailboxes, signals) = load_names()
+      output = open(args.watch_output, 'a') if args.watch_output else sys.stderr
+      watcher = Watcher(args.watch, args.watch_window, args.watch_min, mailboxes, signals, output)
+    stream_files(args.input_file, watcher)
     exit(0)
 
-  files = get_input_files(args.input_file)
-  if len(files) == 0:
-    print_stderr("No ship files found!")
+  if args.compare:
+    (mailboxes, signals) = load_names()
+    print_compare(args.compare[0], args.compare[1], mailboxes, signals)
+    exit(0)
+
+  # A time of day is ambiguous in a ring that spans midnight, which must not decide what is cleared
+  if args.clear and args.from_time:
+    print_stderr("--clear only takes --until")
+    exit(1)
+  if args.clear and args.until_time and args.until_time[1]:
+    print_stderr("--clear --until needs a date and time or seconds since the epoch, not a time of day")
     exit(1)
 
-  if args.clear:
-    print ("Clearing %u files" % len(files))
-    for i in files:
-      clear_file(i)
-    exit(0)
+  if args.query:
+    if not args.sqlite:
+      print_stderr("--query needs a database, see --sqlite")
+      exit(1)
+    if os.path.exists(args.sqlite) and len(args.input_file) == 0:
+      print_query(args.sqlite, args.query)
+      exit(0)
+
+  if args.server:
+    # The server applies the signal and mailbox filters
+    profiler.start('fetch')
+    data = load_server_entries(args.server)
+    profiler.count(len(data))
+  else:
+    profiler.start('discover')
+    files = get_input_files(args.input_file)
+    profiler.count(len(files))
+    profiler.stop()
+    if len(files) == 0:
+      print_stderr("No ship files found!")
+      exit(1)
 
-  data = []
-  for f in files:
-    if is_text(f):
-      data.extend(read_text(f))
-    else:
-      data.extend(read_binary(f, False))
+    if args.clear:
+      print ("Clearing %u files" % len(files))
+      cleared = clear_files(files, args.until_time[0] if args.until_time else None)
+      print ("Cleared %.1f MB" % (cleared / 1e6))
+      exit(0)
 
-  data = sorted(data, key = lambda i: (i['seconds'], i['microseconds']))
-  find_pairs(data)
+    if args.serve:
+      serve(files, args.serve)
+      exit(0)
+
+    data = load_entries(files)
 
   if args.text:
+    profiler.start('output')
+    profiler.count(len(data))
     print_ship_entries_text(data)
     exit(0)
 
-  if args.mailboxes:
-    mailboxes = read_mailboxes(args.mailboxes)
-  else:
-    mailboxes = get_mailboxes()
-
-  if args.signals:
-    signals = parse_signals(args.signals)
+  profiler.start('names')
+  if args.server:
+    (mailboxes, signals) = load_server_names(args.server)
   else:
-    f = find_signal_file()
-    if f is not None:
-      signals = parse_signals(f)
-    else:
-      signals = {}
-
-  if args.signal_filter or args.mailbox_filter:
-    (alls,_) = filter_ids( args.signal_filter, get_all_signals(data), signals )
-    if args.mailbox_filter and args.mailbox_filter.find(":") >= 0:
-      (f1,f2) = args.mailbox_filter.split(":")
-      (allm1,_) = filter_ids( f1, get_all_boxes(data), mailboxes )
-      (allm2,_) = filter_ids( f2, get_all_boxes(data), mailboxes )
-      data = [ d for d in data if d['signo'] in alls
-               and ( d['sender'] in allm1 and d['receiver'] in allm2
-                     or d['sender'] in allm2 and d['receiver'] in allm1)]
-    else:
-      (allm,exm) = filter_ids( args.mailbox_filter, get_all_boxes(data), mailboxes )
-      data = [ d for d in data if d['signo'] in alls
-               and ( d['sender'] in allm or d['receiver'] in allm )
-               and d['sender'] not in exm and d['receiver'] not in exm]
+    (mailboxes, signals) = load_names()
+  profiler.count(len(mailboxes) + len(signals))
+
+  if filters_given():
+    profiler.start('filter')
+    if not args.server:
+      data = apply_filters(data, mailboxes, signals)
+    elif args.from_time or args.until_time:
+      data = apply_time_filter(data)
+    profiler.count(len(data))
     if len(data)==0:
-      print_stderr("No signals selected! Check your filters or try --summary without filters.", file=sys.stderr)
+      print_stderr("No signals selected! Check your filters or try --summary without filters.")
       exit(1)
 
+  # The output stage ends at exit
+  profiler.start('output')
+  profiler.count(len(data))
+
+  if args.extract:
+    write_binary(args.extract, data)
+    exit(0)
+
   if args.uml:
     print_uml(data, mailboxes, signals)
     exit(0)
@@ -678,5 +2456,22 @@ if __name__ == "__main__":
     print_summary(data, mailboxes, signals)
     exit(0)
 
+  if args.timeline:
+    print_timeline(data, mailboxes, signals)
+    exit(0)
+
+  if args.sqlite:
+    if args.append:
+      append_sqlite(args.sqlite, data, mailboxes, signals)
+    else:
+      write_sqlite(args.sqlite, data, mailboxes, signals)
+    if args.query:
+      print_query(args.sqlite, args.query)
+    exit(0)
+
+  if args.transactions:
+    print_transactions(data, mailboxes, signals)
+    exit(0)
+
   print_ship_entries(data, mailboxes, signals)
 